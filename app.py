@@ -1,8 +1,153 @@
-from flask import Flask, render_template, jsonify, request
+import gc
+import gzip
+import json
+import os
+from hashlib import sha256
+from time import perf_counter
 
-from wrappers_tp import HtmlTP
+startup_started = perf_counter()
+
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context, g
+
+import batching
+import metrics
+
+from cache import AnalysisCache, SqliteBackend, text_key
+from charts import chart_formats, renderer, load_matplotlib
+from corpus_index import CorpusIndex
+from jobs import JobManager, QueueFull
+from models import warm_up, get_lemma_memo
+from sentence_cache import SentenceCache
+from sharding import ShardPool
+from text_processing import russian_stopwords
+from wrappers_tp import HtmlTP, iter_sections, process_sections, morph_sections, summary_sections, ner_sections
 
 app = Flask(__name__)
+metrics.startup_seconds.set(perf_counter() - startup_started, phase='imports')
+# eager - модели загружаются при запуске, lazy - при первом запросе,
+# prefork - для запуска с предварительной загрузкой приложения до fork (gunicorn --preload)
+warm_up_mode = os.environ.get('TEXT_STATS_WARM_UP', 'eager')
+if warm_up_mode not in ('eager', 'lazy', 'prefork'):
+    raise ValueError(f'Unknown warm up mode: {warm_up_mode}')
+if warm_up_mode != 'lazy':
+    warm_up()
+get_lemma_memo().configure(max_size=int(os.environ.get('TEXT_STATS_LEMMA_MEMO_SIZE', 200000)),
+                           policy=os.environ.get('TEXT_STATS_LEMMA_MEMO_POLICY', 'lru'))
+# Объединение вызовов теггеров из одновременных запросов в общие пакеты
+batching.configure(max_batch_size=int(os.environ.get('TEXT_STATS_BATCH_SIZE', 64)),
+                   max_wait=float(os.environ.get('TEXT_STATS_BATCH_WAIT_MS', 2)) / 1000)
+# Кэш разбора по предложениям: при повторном анализе изменённого текста размечаются только новые предложения
+sentence_cache_size = int(os.environ.get('TEXT_STATS_SENTENCE_CACHE', 50000))
+sentence_cache = SentenceCache(sentence_cache_size) if sentence_cache_size > 0 else None
+# Разбор больших документов по шардам из предложений в пуле процессов
+shard_workers = int(os.environ.get('TEXT_STATS_SHARD_WORKERS', 0))
+shard_pool = ShardPool(shard_workers, min_sentences=int(os.environ.get('TEXT_STATS_SHARD_MIN_SENTENCES', 400))) \
+    if shard_workers > 0 else None
+analysis_cache = AnalysisCache(lambda text: HtmlTP(text, sentence_cache=sentence_cache, shard_pool=shard_pool),
+                               max_bytes=int(os.environ.get('TEXT_STATS_CACHE_MB', 256)) * 1024 ** 2,
+                               backend=SqliteBackend(os.environ['TEXT_STATS_CACHE_DB'])
+                               if os.environ.get('TEXT_STATS_CACHE_DB') else None,
+                               restore=lambda tp: tp.attach(sentence_cache, shard_pool))
+# Индекс частот по корпусу документов, добавленных через POST /corpus
+corpus_index = CorpusIndex(os.environ['TEXT_STATS_CORPUS_DB']) if os.environ.get('TEXT_STATS_CORPUS_DB') else None
+# Вид задачи -> (профиль анализа, разделы ответа)
+job_kinds = {'process': ('full', process_sections),
+             'morph': ('morph', morph_sections),
+             'summary': ('summary', summary_sections)}
+job_manager = JobManager(analysis_cache.get, job_kinds,
+                         workers=int(os.environ.get('TEXT_STATS_JOB_WORKERS', 2)),
+                         max_pending=int(os.environ.get('TEXT_STATS_JOB_QUEUE', 32)))
+# Сжатие ответов gzip, если клиент его поддерживает; 0 - не сжимать
+gzip_level = int(os.environ.get('TEXT_STATS_GZIP_LEVEL', 6))
+gzip_min_size = 1024
+compressible_types = ('application/json', 'text/html', 'text/plain', 'image/svg+xml')
+# Разбивка времени по этапам в ответах; также включается режимом отладки Flask
+debug_timings = bool(os.environ.get('TEXT_STATS_DEBUG_TIMINGS'))
+
+
+def cache_stats():
+    yield 'analysis', analysis_cache.stats()
+    yield 'lemma', get_lemma_memo().stats()
+    if sentence_cache is not None:
+        yield 'sentence', sentence_cache.stats()
+
+
+def cache_samples():
+    for cache, stats in cache_stats():
+        for event in ('hits', 'disk_hits', 'misses', 'evictions'):
+            if event in stats:
+                yield (cache, event), stats[event]
+
+
+def cache_hit_rates():
+    stats = analysis_cache.stats()
+    lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+    yield ('analysis',), (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0
+    yield ('lemma',), get_lemma_memo().stats()['hit_rate']
+    if sentence_cache is not None:
+        yield ('sentence',), sentence_cache.stats()['hit_rate']
+
+
+if warm_up_mode == 'prefork':
+    # Всё, что загружается лениво, загружается заранее в главном процессе. gc.freeze убирает загруженные объекты
+    # из обхода сборщика мусора, чтобы рабочие процессы не копировали их страницы при сборке
+    load_matplotlib()
+    russian_stopwords()
+    gc.collect()
+    gc.freeze()
+metrics.startup_seconds.set(perf_counter() - startup_started, phase='ready')
+
+
+metrics.Gauge('text_stats_cache_events', 'Обращения к кэшам', ('cache', 'event'), collect=cache_samples)
+metrics.Gauge('text_stats_cache_hit_rate', 'Доля попаданий в кэш', ('cache',), collect=cache_hit_rates)
+metrics.Gauge('text_stats_cache_bytes', 'Оценка размера кэша документов в памяти',
+              collect=lambda: {(): analysis_cache.stats()['bytes']})
+metrics.Gauge('text_stats_queue_depth', 'Длина очередей', ('pool',),
+              collect=lambda: {('charts',): renderer.pending, ('jobs',): job_manager.pending,
+                               **{(name,): depth for name, depth in batching.queue_depths().items()}})
+
+
+@app.before_request
+def start_timer():
+    g.started = perf_counter()
+    if debug_timings or app.debug:
+        g.breakdown, g.breakdown_token = metrics.start_breakdown()
+
+
+@app.after_request
+def record_request(response):
+    route = request.endpoint or 'unknown'
+    metrics.request_seconds.observe(perf_counter() - g.started, route=route)
+    metrics.requests_total.inc(route=route, status=response.status_code)
+    return response
+
+
+@app.after_request
+def compress(response):
+    # Потоковые ответы (/morph?stream, события задач) не сжимаются, чтобы клиент получал их по частям
+    if (not gzip_level or response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in compressible_types
+            or not request.accept_encodings['gzip']):
+        return response
+    data = response.get_data()
+    if len(data) >= gzip_min_size:
+        response.set_data(gzip.compress(data, compresslevel=gzip_level))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.teardown_request
+def stop_timer(exc):
+    if 'breakdown_token' in g:
+        metrics.stop_breakdown(g.pop('breakdown_token'))
+
+
+def respond(result):
+    if 'breakdown' in g:
+        result['timings'] = dict(g.breakdown, total=perf_counter() - g.started)
+    with metrics.timed(metrics.serialization_seconds, route=request.endpoint):
+        return jsonify(result)
 
 
 @app.route('/')
@@ -10,54 +155,238 @@ def main():
     return render_template('main.html')
 
 
-@app.route('/process')
-def process():
+class InvalidText(ValueError):
+    pass
+
+
+@app.errorhandler(InvalidText)
+def invalid_text(e):
+    return jsonify({'info_field': 'Текст должен быть строкой'}), 400
+
+
+def request_text():
+    # Текст передаётся телом POST-запроса (как есть или в JSON-поле text) либо первым ключом строки запроса
+    if request.method == 'POST':
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            text = data.get('text') if isinstance(data, dict) else data
+            if text is not None and not isinstance(text, str):
+                raise InvalidText(text)
+            return text
+        return request.get_data(as_text=True)
     try:
-        text = tuple(request.args.items())[0][0]
+        return tuple(request.args.items())[0][0]
     except IndexError:
+        return None
+
+
+def request_options():
+    if request.is_json:
+        return request.get_json(silent=True) or {}
+    return request.args
+
+
+def requested_sections(options):
+    # sections - список разделов через запятую (или массив в JSON); по умолчанию все разделы /process
+    names = options.get('sections')
+    if not names:
+        return process_sections
+    if isinstance(names, str):
+        names = names.split(',')
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise TypeError(names)
+    unknown = set(names) - process_sections.keys()
+    if unknown:
+        raise KeyError(', '.join(sorted(unknown)))
+    return {name: compute for name, compute in process_sections.items() if name in names}
+
+
+def sections_etag(text, sections, fmt):
+    # Ответ однозначно определяется текстом, набором разделов и форматом графиков
+    options = sha256('|'.join((fmt,) + tuple(sorted(sections))).encode('utf-8')).hexdigest()
+    return f'{text_key(text)[:32]}-{options[:16]}'
+
+
+@app.route('/process', methods=['GET', 'POST'])
+def process():
+    text = request_text()
+    if not text:
         return jsonify({'info_field': 'Пожалуйста, введите текст'})
+    options = request_options()
+    fmt = options.get('charts', 'png')
+    if fmt not in chart_formats:
+        return jsonify({'info_field': f'Неизвестный формат графиков: {fmt}'}), 400
+    try:
+        sections = requested_sections(options)
+    except KeyError as e:
+        return jsonify({'info_field': f'Неизвестные разделы: {e.args[0]}'}), 400
+    except TypeError:
+        return jsonify({'info_field': 'Разделы задаются строкой через запятую или массивом строк'}), 400
+    etag = sections_etag(text, sections, fmt)
+    if request.method == 'GET' and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
     else:
-        tp = HtmlTP(text)
-        return jsonify({'gen_stat_data': tp.gen_stats_data(),
-                        'gen_stat_data_with_punct': tp.gen_stats_with_punct(),
-                        'gen_stat_data_wo_punct': tp.gen_stats_wo_punct(),
-                        'pos_stat_table': tp.pos_freq(),
-                        'pos_stat_graph_uses': tp.pos_freq_graph(),
-                        'pos_stat_graph_words': tp.pos_freq_graph(use_tokens=False),
-                        'omon_stat_table': tp.omon_freq(10),
-                        'omon_stat_table_wo_stopwords': tp.omon_freq(10, include_stopwords=False),
-                        'case_analysis_table': tp.case_analysis_table(),
-                        'case_analysis_graph_nouns': tp.case_analysis_graph_nouns(),
-                        'case_analysis_graph_adjs': tp.case_analysis_graph_adjs(),
-                        'case_analysis_graph_sum': tp.case_analysis_graph_sum(),
-                        'verb_forms_analysis_tense_table': tp.verb_form_analysis_tense_table(),
-                        'verb_forms_analysis_person_table': tp.verb_form_analysis_person_table(),
-                        'verb_forms_analysis_number_table': tp.verb_form_analysis_number_table(),
-                        'ner_general': tp.ner_stats_view(),
-                        'ner_tables': tp.top_ners_table(),
-                        })
-
-
-@app.route('/morph')
+        profile = 'full' if any(name in ner_sections for name in sections) else 'morph'
+        tp = analysis_cache.get(text, profile=profile)
+        response = respond(dict(iter_sections(tp, sections, fmt)))
+    # Слабый ETag: сжатое и несжатое представления одного ответа считаются равноценными
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/morph', methods=['GET', 'POST'])
 def morph():
-    try:
-        text = tuple(request.args.items())[0][0]
-    except IndexError:
+    text = request_text()
+    if not text:
         return jsonify({'info_field': 'Пожалуйста, введите текст'})
-    else:
-        tp = HtmlTP(text)
-        return jsonify({'morph_analysis_table': tp.morhp_analysis(include_punct=True)})
+    options = request_options()
+    stream = options.get('stream')
+    try:
+        offset = int(options.get('offset', 0))
+        limit = None if options.get('limit') is None else int(options.get('limit'))
+    except (TypeError, ValueError):
+        offset = -1
+    if stream not in (None, 'html', 'ndjson') or offset < 0 or (limit is not None and limit < 0):
+        return jsonify({'info_field': 'Неверные параметры запроса'}), 400
+    tp = analysis_cache.get(text, profile='morph')
+    if stream == 'html':
+        return Response(stream_with_context(tp.morph_analysis_chunks(include_punct=True, offset=offset,
+                                                                     limit=limit)),
+                        mimetype='text/html')
+    if stream == 'ndjson':
+        lines = (json.dumps(record, ensure_ascii=False) + '\n'
+                 for record in tp.morph_records(include_punct=True, offset=offset, limit=limit))
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+    result = {'morph_analysis_table': tp.morhp_analysis(include_punct=True, offset=offset, limit=limit)}
+    if limit is not None:
+        total = len(tp.morph_tokens(include_punct=True))
+        result.update({'offset': offset, 'total': total,
+                       'next_offset': offset + limit if offset + limit < total else None})
+    return respond(result)
 
 
-@app.route('/summary')
+@app.route('/summary', methods=['GET', 'POST'])
 def summary():
-    try:
-        text = tuple(request.args.items())[0][0]
-    except IndexError:
+    text = request_text()
+    if not text:
         return jsonify({'info_field': 'Пожалуйста, введите текст'})
-    else:
-        tp = HtmlTP(text)
-        return jsonify({'summ_text': tp.summary()})
+    weights = request_options().get('weights')
+    if weights not in (None, 'frequency', 'tfidf'):
+        return jsonify({'info_field': f'Неизвестные веса: {weights}'}), 400
+    if weights == 'tfidf' and corpus_index is None:
+        return corpus_unavailable()
+    tp = analysis_cache.get(text, profile='summary')
+    return respond({'summ_text': tp.summary(corpus_index.lemma_weights(tp) if weights == 'tfidf' else None)})
+
+
+def corpus_unavailable():
+    return jsonify({'info_field': 'Индекс корпуса не настроен'}), 404
+
+
+def requested_top(options, default):
+    # None - неверное значение параметра top
+    try:
+        top = int(options.get('top', default))
+    except (TypeError, ValueError):
+        return None
+    return top if top >= 0 else None
+
+
+def invalid_top():
+    return jsonify({'info_field': 'Неверное значение параметра top'}), 400
+
+
+@app.route('/corpus', methods=['GET', 'POST'])
+def corpus():
+    if corpus_index is None:
+        return corpus_unavailable()
+    options = request_options()
+    if request.method == 'POST':
+        text = request_text()
+        if not text:
+            return jsonify({'info_field': 'Пожалуйста, введите текст'}), 400
+        corpus_index.add_document(analysis_cache.get(text, profile='full'), options.get('name'))
+        return respond(corpus_index.totals())
+    top = requested_top(options, 20)
+    if top is None:
+        return invalid_top()
+    result = corpus_index.summary(top)
+    if options.get('pos'):
+        result['top_lemmas'] = corpus_index.top_lemmas(top, options['pos'])
+    return respond(result)
+
+
+@app.route('/corpus/frequencies')
+def corpus_frequencies():
+    if corpus_index is None:
+        return corpus_unavailable()
+    lemmas = request.args.getlist('lemma')
+    return respond({'documents': corpus_index.totals()['documents'],
+                    'document_frequencies': corpus_index.document_frequencies(lemmas)})
+
+
+@app.route('/corpus/keywords', methods=['GET', 'POST'])
+def corpus_keywords():
+    if corpus_index is None:
+        return corpus_unavailable()
+    text = request_text()
+    if not text:
+        return jsonify({'info_field': 'Пожалуйста, введите текст'}), 400
+    top = requested_top(request_options(), 10)
+    if top is None:
+        return invalid_top()
+    tp = analysis_cache.get(text, profile='summary')
+    return respond({'keywords': corpus_index.keywords(tp, top)})
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    text = request_text()
+    if not text:
+        return jsonify({'info_field': 'Пожалуйста, введите текст'}), 400
+    options = request_options()
+    kind = options.get('kind', 'process')
+    fmt = options.get('charts', 'png')
+    if kind not in job_kinds or fmt not in chart_formats:
+        return jsonify({'info_field': 'Неверные параметры запроса'}), 400
+    try:
+        job = job_manager.submit(text, kind, fmt)
+    except QueueFull:
+        return jsonify({'info_field': 'Сервер перегружен, повторите запрос позже'}), 503, {'Retry-After': '5'}
+    return jsonify(job.status_view()), 202, {'Location': f'/jobs/{job.id}'}
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'info_field': 'Задача не найдена'}), 404
+    return jsonify(job.status_view())
+
+
+@app.route('/jobs/<job_id>/sections/<name>')
+def job_section(job_id, name):
+    job = job_manager.get(job_id)
+    if job is None or name not in job.section_names:
+        return jsonify({'info_field': 'Задача или раздел не найдены'}), 404
+    if name not in job.sections:
+        return jsonify(job.status_view()), 202
+    return jsonify({name: job.sections[name]})
+
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'info_field': 'Задача не найдена'}), 404
+    events = (f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n' for event, data in job.events())
+    return Response(stream_with_context(events), mimetype='text/event-stream')
+
+
+@app.route('/metrics')
+def metrics_view():
+    return Response(metrics.render_all(), mimetype='text/plain; version=0.0.4')
 
 
 if __name__ == '__main__':
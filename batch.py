@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from cache import text_key
+from corpus_index import CorpusIndex
+from corpus_stats import CorpusStats, safe_compute
+from models import warm_up
+from text_processing import TextProcessing
+
+
+def find_documents(source, pattern='.txt'):
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith(pattern):
+                    yield os.path.join(root, name)
+    else:
+        # Манифест: по одному пути к файлу на строку, пути относительно манифеста
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding='utf-8') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield os.path.join(base, line)
+
+
+def analyse_document(path, encoding='utf-8'):
+    try:
+        with open(path, encoding=encoding) as f:
+            text = f.read()
+        tp = TextProcessing(text, profile='full')
+        stats = CorpusStats().add_document(tp)
+        record = stats.summary()
+        del record['documents']
+        record.update({'path': path,
+                       'key': text_key(text),
+                       'avg_sent_len': safe_compute(tp.avg_sent_len),
+                       'omonyms_freq': safe_compute(tp.omonyms_freq_compute),
+                       'summary': safe_compute(tp.simple_summarization),
+                       'counters': stats.to_dict()})
+        return record
+    except Exception as e:
+        return {'path': path, 'error': f'{type(e).__name__}: {e}'}
+
+
+def load_checkpoint(output):
+    # Выходной JSONL служит контрольной точкой: успешно обработанные файлы пропускаются при перезапуске
+    done, total = set(), CorpusStats()
+    if not os.path.exists(output):
+        return done, total
+    good_offset = 0
+    with open(output, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b'\n'):
+                break
+            good_offset += len(line)
+            if 'error' not in record:
+                done.add(record['path'])
+                total.merge(CorpusStats.from_dict(record['counters']))
+    # Обрезаем недописанную последнюю строку после аварийной остановки
+    with open(output, 'ab') as f:
+        f.truncate(good_offset)
+    return done, total
+
+
+def run(source, output, summary_path=None, workers=None, encoding='utf-8', top=20, index_path=None):
+    done, total = load_checkpoint(output)
+    # Индекс корпуса пополняется в главном процессе из тех же счётчиков, что пишутся в JSONL
+    corpus_index = CorpusIndex(index_path) if index_path else None
+    paths = (path for path in find_documents(source) if path not in done)
+    workers = workers or os.cpu_count()
+    processed = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up) as pool, \
+            open(output, 'a', encoding='utf-8') as out:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 4:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(analyse_document, path, encoding))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                if 'error' in record:
+                    failed += 1
+                    print(f'{record["path"]}: {record["error"]}', file=sys.stderr)
+                else:
+                    processed += 1
+                    stats = CorpusStats.from_dict(record['counters'])
+                    total.merge(stats)
+                    if corpus_index is not None:
+                        corpus_index.add_stats(stats, record['key'], record['path'])
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+    with open(summary_path or output + '.summary.json', 'w', encoding='utf-8') as f:
+        json.dump(total.summary(top), f, ensure_ascii=False, indent=1)
+    return processed, len(done), failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетный статистический анализ корпуса текстов')
+    parser.add_argument('source', help='каталог с файлами .txt или манифест со списком файлов')
+    parser.add_argument('-o', '--output', required=True, help='выходной JSONL, он же контрольная точка')
+    parser.add_argument('-s', '--summary', help='сводка по корпусу (по умолчанию <output>.summary.json)')
+    parser.add_argument('-w', '--workers', type=int, help='число процессов (по умолчанию число ядер)')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--top', type=int, default=20, help='размер списков именованных сущностей в сводке')
+    parser.add_argument('--index', help='файл SQLite индекса корпуса, в который добавляются документы')
+    args = parser.parse_args(argv)
+    processed, skipped, failed = run(args.source, args.output, args.summary, args.workers, args.encoding, args.top,
+                                     args.index)
+    print(f'Обработано: {processed}, пропущено по контрольной точке: {skipped}, ошибок: {failed}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import os
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+from threading import Thread, Lock
+from time import perf_counter
+
+from metrics import tagger_batch_items, tagger_batch_wait_seconds
+from models import loaders
+
+# Теггеры, вызовы которых объединяются между одновременными запросами
+batched_models = ('morph_tagger', 'syntax_parser', 'ner_tagger')
+_batchers = {}
+_lock = Lock()
+
+
+class _Request:
+    # Запрос одного вызывающего: элементы уходят в модель частями, результаты собираются на месте
+    def __init__(self, items, future, queued):
+        self.items = items
+        self.future = future
+        self.queued = queued
+        self.results = [None] * len(items)
+        self.offset = 0
+        self.remaining = len(items)
+
+
+class MicroBatcher:
+    # Собирает предложения (или тексты для NER) из разных запросов в общий вызов модели и раздаёт результаты.
+    # Поддерживает map и __call__ как у теггеров natasha, поэтому подходит для Doc.tag_morph и подобных методов
+    def __init__(self, name, max_batch_size=64, max_wait=0.002):
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = Queue()
+        # Запросы, элементы которых ещё не ушли в модель; доступны только потоку планировщика
+        self._pending = deque()
+        self._thread = Thread(target=self._loop, name=f'batcher-{name}', daemon=True)
+        self._thread.start()
+
+    def map(self, items):
+        items = list(items)
+        if not items:
+            return iter(())
+        future = Future()
+        self._queue.put(_Request(items, future, perf_counter()))
+        return iter(future.result())
+
+    def __call__(self, item):
+        return next(self.map([item]))
+
+    def _collect(self):
+        # Новый запрос ждём сколько угодно, только если не осталось недоразобранных;
+        # следующие - не дольше max_wait и пока элементов не хватает на полный пакет
+        if not self._pending:
+            request = self._queue.get()
+            if request is None:
+                return None
+            self._pending.append(request)
+        size = sum(len(request.items) - request.offset for request in self._pending)
+        deadline = perf_counter() + self.max_wait
+        # Уже ждущие запросы забираются всегда, даже если элементов хватает: иначе они не встанут
+        # в очередь между частями большого запроса
+        while True:
+            try:
+                request = self._queue.get_nowait() if size >= self.max_batch_size or not self.max_wait else \
+                    self._queue.get(timeout=max(deadline - perf_counter(), 0))
+            except Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            self._pending.append(request)
+            size += len(request.items)
+        return self._slices()
+
+    def _slices(self):
+        # Пакет не больше max_batch_size: запросы отдают элементы по очереди, и большой запрос
+        # не занимает модель целиком, пока остальные ждут
+        batch, size = [], 0
+        while self._pending and size < self.max_batch_size:
+            request = self._pending.popleft()
+            start = request.offset
+            stop = min(len(request.items), start + self.max_batch_size - size)
+            request.offset = stop
+            batch.append((request, start, stop))
+            size += stop - start
+            if stop < len(request.items):
+                self._pending.append(request)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._run(batch)
+
+    def _run(self, batch):
+        started = perf_counter()
+        items = [item for request, start, stop in batch for item in request.items[start:stop]]
+        for request, start, _ in batch:
+            if start == 0:
+                tagger_batch_wait_seconds.observe(started - request.queued, model=self.name)
+        tagger_batch_items.observe(len(items), model=self.name)
+        try:
+            model = loaders[self.name]()
+            # Внутренний размер пакета модели поднимается до размера общего пакета: отдельные вызовы
+            # идут только из этого потока, а результаты от размера пакета не зависят
+            model.batch_size = max(model.batch_size, self.max_batch_size)
+            # Близкие по длине элементы идут в один внутренний пакет - меньше выравнивания
+            order = sorted(range(len(items)), key=lambda i: len(items[i]))
+            results = [None] * len(items)
+            for i, result in zip(order, model.map([items[i] for i in order])):
+                results[i] = result
+        except Exception as e:
+            failed = {id(request) for request, _, _ in batch}
+            for request, _, _ in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            # Остальные части упавших запросов в модель уже не отправляются
+            self._pending = deque(request for request in self._pending if id(request) not in failed)
+            return
+        offset = 0
+        for request, start, stop in batch:
+            request.results[start:stop] = results[offset:offset + stop - start]
+            offset += stop - start
+            request.remaining -= stop - start
+            if request.remaining == 0:
+                request.future.set_result(request.results)
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    @property
+    def pending(self):
+        return self._queue.qsize() + len(self._pending)
+
+
+def configure(max_batch_size=64, max_wait=0.002):
+    # max_batch_size=0 выключает объединение: теггеры вызываются напрямую в потоке запроса
+    with _lock:
+        for batcher in _batchers.values():
+            batcher.stop()
+        _batchers.clear()
+        if max_batch_size > 0:
+            for name in batched_models:
+                _batchers[name] = MicroBatcher(name, max_batch_size, max_wait)
+
+
+def _restart_after_fork():
+    # Потоки планировщиков не переживают fork: в дочернем процессе они создаются заново с теми же настройками
+    global _lock
+    _lock = Lock()
+    settings = tuple((name, batcher.max_batch_size, batcher.max_wait) for name, batcher in _batchers.items())
+    _batchers.clear()
+    for name, max_batch_size, max_wait in settings:
+        _batchers[name] = MicroBatcher(name, max_batch_size, max_wait)
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_tagger(name):
+    batcher = _batchers.get(name)
+    return batcher if batcher is not None else loaders[name]()
+
+
+def queue_depths():
+    return {name: batcher.pending for name, batcher in _batchers.items()}
@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from statistics import median
+from time import perf_counter
+
+from metrics import process_memory
+from models import warm_up, get_lemma_memo
+from wrappers_tp import HtmlTP
+
+corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus.txt')
+# Корпуса растущего размера: во сколько раз повторяется базовый текст. Повторы попадают в память лемматизации
+# и другие запомненные результаты, поэтому на x4 и x16 пропускная способность выше, чем на разных текстах того же размера
+corpus_sizes = {'x1': 1, 'x4': 4, 'x16': 16}
+# Меньшие изменения времени и пика памяти не считаются регрессией даже при превышении порога в долях:
+# у коротких замеров это шум
+min_time_delta = 0.001
+min_memory_delta_kb = 64
+stage_order = ('segment', 'morph', 'lemma', 'syntax', 'ner', 'normalize')
+stat_methods = {'index': lambda tp: tp.index,
+                'pos_freq_compute': lambda tp: tp.pos_freq_compute(),
+                'omonyms_freq_compute': lambda tp: tp.omonyms_freq_compute(),
+                'omonyms_freq_compute_wo_stopwords': lambda tp: tp.omonyms_freq_compute(False),
+                'case_analysis': lambda tp: tp.case_analysis(),
+                'simple_summarization': lambda tp: tp.simple_summarization(),
+                'top_ners': lambda tp: tp.top_ners()}
+renderers = {'morhp_analysis': lambda tp: tp.morhp_analysis(include_punct=True),
+             'gen_stats': lambda tp: (tp.gen_stats_data(), tp.gen_stats_with_punct(), tp.gen_stats_wo_punct()),
+             'pos_freq': lambda tp: tp.pos_freq(),
+             'pos_freq_graph': lambda tp: tp.pos_freq_graph(),
+             'omon_freq': lambda tp: tp.omon_freq(10),
+             'case_analysis_table': lambda tp: tp.case_analysis_table(),
+             'case_analysis_graphs': lambda tp: (tp.case_analysis_graph_nouns(), tp.case_analysis_graph_adjs(),
+                                                 tp.case_analysis_graph_sum()),
+             'verb_form_tables': lambda tp: (tp.verb_form_analysis_tense_table(),
+                                             tp.verb_form_analysis_person_table(),
+                                             tp.verb_form_analysis_number_table()),
+             'ner_tables': lambda tp: (tp.ner_stats_view(), tp.top_ners_table()),
+             'summary': lambda tp: tp.summary()}
+
+
+def load_corpus(times):
+    with open(corpus_path, encoding='utf-8') as f:
+        text = f.read()
+    return '\n\n'.join((text,) * times)
+
+
+def measurements(tp):
+    # Порядок важен: этапы конвейера выполняются по одному, статистика считается по готовому документу
+    for stage in stage_order:
+        yield 'stage', stage, lambda tp, stage=stage: tp.require(stage)
+    for name, run in stat_methods.items():
+        yield 'stat', name, run
+    for name, run in renderers.items():
+        yield 'render', name, run
+
+
+def run_once(text, trace_memory=False):
+    # Память лемматизации сбрасывается, чтобы повторы текста не ускоряли следующие прогоны
+    get_lemma_memo().clear()
+    tp = HtmlTP(text)
+    results = {}
+    for group, name, run in measurements(tp):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        run(tp)
+        seconds = perf_counter() - start
+        results[group, name] = (seconds, tracemalloc.get_traced_memory()[1] if trace_memory else None)
+    return tp, results
+
+
+def bench_corpus(text, repeat):
+    timings = {}
+    tp = None
+    for _ in range(repeat):
+        tp, results = run_once(text)
+        for key, (seconds, _) in results.items():
+            timings.setdefault(key, []).append(seconds)
+    tracemalloc.start()
+    try:
+        _, memory = run_once(text, trace_memory=True)
+    finally:
+        tracemalloc.stop()
+    tokens = len(tp.doc.tokens)
+    report = {'tokens': tokens, 'sentences': len(tp.doc.sents), 'chars': len(text)}
+    for (group, name), values in timings.items():
+        seconds = median(values)
+        report.setdefault(group, {})[name] = {'seconds': seconds,
+                                              'tokens_per_second': tokens / seconds if seconds else None,
+                                              'peak_kb': memory[group, name][1] // 1024}
+    return report
+
+
+def run_benchmarks(sizes, repeat):
+    start = perf_counter()
+    warm_up()
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'model_loading_seconds': perf_counter() - start, 'repeat': repeat,
+                       'memory_mb': {kind: size / 2 ** 20 for (kind,), size in process_memory().items()}},
+              'corpora': {}}
+    for name in sizes:
+        report['corpora'][name] = bench_corpus(load_corpus(corpus_sizes[name]), repeat)
+    return report
+
+
+def compare(report, baseline, time_threshold, memory_threshold):
+    regressions = []
+    for corpus, groups in report['corpora'].items():
+        base_groups = baseline['corpora'].get(corpus, {})
+        for group in ('stage', 'stat', 'render'):
+            for name, current in groups.get(group, {}).items():
+                base = base_groups.get(group, {}).get(name)
+                if base is None:
+                    continue
+                if current['seconds'] > base['seconds'] * (1 + time_threshold) + min_time_delta:
+                    regressions.append(f'{corpus} {group} {name}: время {base["seconds"]:.4f} -> '
+                                       f'{current["seconds"]:.4f} с')
+                if current['peak_kb'] > base['peak_kb'] * (1 + memory_threshold) + min_memory_delta_kb:
+                    regressions.append(f'{corpus} {group} {name}: память {base["peak_kb"]} -> '
+                                       f'{current["peak_kb"]} КБ')
+    return regressions
+
+
+def print_report(report):
+    print(f'Загрузка моделей: {report["meta"]["model_loading_seconds"]:.2f} с')
+    memory = report['meta'].get('memory_mb', {})
+    if memory:
+        print('Память процесса после загрузки: ' + ', '.join(f'{kind} {size:.0f} МБ' for kind, size in memory.items()))
+    for corpus, groups in report['corpora'].items():
+        print(f'\n{corpus}: {groups["tokens"]} токенов, {groups["sentences"]} предложений')
+        for group in ('stage', 'stat', 'render'):
+            for name, m in groups[group].items():
+                tps = f'{m["tokens_per_second"]:.0f}' if m['tokens_per_second'] else '-'
+                print(f'  {group:6} {name:36} {m["seconds"] * 1000:10.2f} мс {tps:>12} ток/с {m["peak_kb"]:8} КБ')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры скорости и памяти конвейера TextProcessing и HtmlTP')
+    parser.add_argument('--sizes', nargs='+', choices=corpus_sizes.keys(), default=list(corpus_sizes.keys()))
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='число прогонов, берётся медиана')
+    parser.add_argument('--save', help='сохранить результаты в JSON (новый базовый уровень)')
+    parser.add_argument('--baseline', help='сравнить с сохранёнными результатами')
+    parser.add_argument('--time-threshold', type=float, default=0.2, help='допустимое замедление, доля')
+    parser.add_argument('--memory-threshold', type=float, default=0.2, help='допустимый рост пика памяти, доля')
+    args = parser.parse_args(argv)
+    report = run_benchmarks(args.sizes, args.repeat)
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.time_threshold, args.memory_threshold)
+        if regressions:
+            print('\nРегрессии:')
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('\nРегрессий нет')
+
+
+if __name__ == '__main__':
+    main()
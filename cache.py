@@ -0,0 +1,118 @@
+import pickle
+import sqlite3
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+
+from text_processing import profiles
+
+# Приблизительный размер в памяти: DocToken со словарём feats и строками, DocSpan
+token_bytes = 800
+span_bytes = 400
+# Меняется при изменении формата сохраняемых документов
+cache_version = 2
+
+
+def text_key(text):
+    return sha256(text.encode('utf-8')).hexdigest()
+
+
+def estimate_size(tp):
+    if tp.is_compact:
+        return tp.store.nbytes
+    doc = tp.doc
+    return len(doc.text) * 2 + len(doc.tokens or ()) * token_bytes + len(doc.spans or ()) * span_bytes
+
+
+class SqliteBackend:
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        with self._lock, sqlite3.connect(self.path) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS analyses '
+                         '(key TEXT PRIMARY KEY, version INTEGER, stages TEXT, data BLOB)')
+
+    def load(self, key):
+        with self._lock, sqlite3.connect(self.path) as conn:
+            row = conn.execute('SELECT data FROM analyses WHERE key = ? AND version = ?',
+                               (key, cache_version)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def save(self, key, tp):
+        data = pickle.dumps(tp, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, sqlite3.connect(self.path) as conn:
+            conn.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?)',
+                         (key, cache_version, ','.join(sorted(tp.done_stages)), data))
+
+
+class AnalysisCache:
+    def __init__(self, factory, max_bytes=256 * 1024 ** 2, backend=None, restore=None):
+        self.factory = factory
+        # Вызывается для документа, загруженного с диска: возвращает ему то, что не сохраняется вместе с ним
+        self.restore = restore
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text, profile=None):
+        key = text_key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            tp, persisted = entry[0], entry[1]
+        else:
+            tp, persisted = None, frozenset()
+            if self.backend is not None:
+                tp = self.backend.load(key)
+                if tp is not None:
+                    if self.restore is not None:
+                        self.restore(tp)
+                    persisted = frozenset(tp.done_stages)
+                    with self._lock:
+                        self.disk_hits += 1
+            if tp is None:
+                with self._lock:
+                    self.misses += 1
+                tp = self.factory(text)
+        if profile is not None:
+            tp.require(*profiles[profile])
+        # В кэше документы хранятся в компактном столбцовом виде
+        tp.compact()
+        if self.backend is not None and tp.done_stages != persisted:
+            self.backend.save(key, tp)
+            persisted = frozenset(tp.done_stages)
+        self._put(key, tp, persisted)
+        return tp
+
+    def _put(self, key, tp, persisted):
+        size = estimate_size(tp)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            self._entries[key] = (tp, persisted, size)
+            self.size += size
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size,
+                    'hits': self.hits, 'disk_hits': self.disk_hits,
+                    'misses': self.misses, 'evictions': self.evictions}
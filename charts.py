@@ -0,0 +1,102 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from metrics import timed, chart_render_seconds
+
+# png - картинка в base64, svg - встроенная разметка, data - данные для отрисовки на клиенте
+chart_formats = ('png', 'svg', 'data')
+
+
+def bar_chart(title, labels, values):
+    return {'type': 'bar', 'title': title, 'labels': list(labels), 'values': list(values)}
+
+
+def pie_chart(title, labels, values):
+    return {'type': 'pie', 'title': title, 'labels': list(labels), 'values': list(values)}
+
+
+def draw_bar(fig, chart):
+    ax = fig.subplots()
+    fig.set_size_inches(20, 8)
+    ax.tick_params(axis='y', labelsize=12)
+    ax.barh(chart['labels'], chart['values'], align='center')
+    ax.set_yticks(chart['labels'])
+    ax.set_yticklabels(chart['labels'])
+    ax.invert_yaxis()
+    fig.suptitle(chart['title'], fontsize=20)
+
+
+def draw_pie(fig, chart):
+    ax = fig.subplots()
+    ax.pie(chart['values'], labels=chart['labels'], autopct='%1.1f%%', shadow=True, startangle=90)
+    ax.axis('equal')
+    fig.suptitle(chart['title'])
+
+
+drawers = {'bar': draw_bar, 'pie': draw_pie}
+
+
+def fig_to_html(fig):
+    tempfile = BytesIO()
+    fig.savefig(tempfile, format='png')
+    encoded = base64.b64encode(tempfile.getvalue()).decode('utf-8')
+    return '<img class="img img-fluid" src=\'data:image/png;base64,{}\'>'.format(encoded)
+
+
+def fig_to_svg(fig):
+    tempfile = BytesIO()
+    fig.savefig(tempfile, format='svg')
+    return tempfile.getvalue().decode('utf-8')
+
+
+def load_matplotlib():
+    # matplotlib импортируется при первой отрисовке: процессы без графиков не тратят на него время и память
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasAgg
+
+
+def render_chart(chart, fmt='png'):
+    if fmt not in chart_formats:
+        raise ValueError(f'Unknown chart format: {fmt}')
+    if fmt == 'data':
+        return chart
+    # Figure без pyplot не попадает в глобальный реестр фигур и освобождается сразу после отрисовки
+    Figure, FigureCanvasAgg = load_matplotlib()
+    with timed(chart_render_seconds, type=chart['type'], format=fmt):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        try:
+            drawers[chart['type']](fig, chart)
+            return fig_to_html(fig) if fmt == 'png' else fig_to_svg(fig)
+        finally:
+            fig.clear()
+
+
+class ChartRenderer:
+    def __init__(self, workers=2):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='charts')
+        self._lock = Lock()
+        self.pending = 0
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, chart, fmt='png'):
+        with self._lock:
+            self.pending += 1
+        future = self._pool.submit(render_chart, chart, fmt)
+        future.add_done_callback(self._done)
+        return future
+
+    def render(self, chart, fmt='png'):
+        return self.submit(chart, fmt).result()
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+renderer = ChartRenderer()
@@ -0,0 +1,167 @@
+import sqlite3
+from collections import Counter
+from math import log
+from threading import Lock
+from time import time
+
+from cache import text_key
+from corpus_stats import CorpusStats
+from text_processing import ner_types, russian_stopwords
+
+# Таблица частот -> ключевые столбцы. Для каждой есть таблица по документам doc_<имя>
+# и сводная таблица <имя> с общим числом употреблений и числом документов
+frequency_tables = {'lemmas': ('lemma',),
+                    'pos_lemmas': ('pos', 'lemma'),
+                    'forms': ('form',),
+                    'pos': ('pos',),
+                    'ners': ('type', 'normal')}
+
+
+def document_frequencies(stats):
+    # Частоты одного документа в виде {таблица: {ключ: число}}
+    index = stats.index
+    return {'lemmas': {(lemma,): count for lemma, count in index.word_lemma_freqs.items()},
+            'pos_lemmas': {(pos, lemma): count for pos, counter in index.word_lemmas.items()
+                           for lemma, count in counter.items()},
+            'forms': {(form,): count for form, count in index.word_forms.items()},
+            'pos': {(pos,): count for pos, count in index.pos_usages.items()},
+            'ners': {(ner_type, normal): count for ner_type, counter in stats.ners.items()
+                     for normal, count in counter.items()}}
+
+
+class CorpusIndex:
+    # Частоты лемм, словоформ, частей речи и именованных сущностей по документам в SQLite:
+    # вопросы по корпусу решаются запросами без повторного анализа текстов
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        with self._lock, sqlite3.connect(self.path) as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, key TEXT UNIQUE, name TEXT, '
+                         'sentences INTEGER, tokens INTEGER, words INTEGER, added REAL)')
+            for table, columns in frequency_tables.items():
+                keys = ', '.join(columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS doc_{table} (doc INTEGER, {keys}, count INTEGER, '
+                             f'PRIMARY KEY (doc, {keys})) WITHOUT ROWID')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({keys}, count INTEGER, documents INTEGER, '
+                             f'PRIMARY KEY ({keys})) WITHOUT ROWID')
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_count ON {table} (count)')
+
+    def _update_totals(self, conn, table, rows, sign):
+        columns = frequency_tables[table]
+        keys = ', '.join(columns)
+        placeholders = ', '.join('?' * (len(columns) + 2))
+        conn.executemany(f'INSERT INTO {table} VALUES ({placeholders}) ON CONFLICT ({keys}) DO UPDATE SET '
+                         f'count = count + excluded.count, documents = documents + excluded.documents',
+                         ((*key, sign * count, sign) for key, count in rows))
+        if sign < 0:
+            conn.execute(f'DELETE FROM {table} WHERE documents <= 0')
+
+    def _remove(self, conn, doc_id):
+        for table, columns in frequency_tables.items():
+            rows = conn.execute(f'SELECT {", ".join(columns)}, count FROM doc_{table} WHERE doc = ?',
+                                (doc_id,)).fetchall()
+            self._update_totals(conn, table, ((row[:-1], row[-1]) for row in rows), -1)
+            conn.execute(f'DELETE FROM doc_{table} WHERE doc = ?', (doc_id,))
+        conn.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+
+    def add_stats(self, stats, key, name=None):
+        # Документ с тем же ключом заменяется, поэтому повторное добавление не удваивает частоты
+        frequencies = document_frequencies(stats)
+        with self._lock, sqlite3.connect(self.path) as conn:
+            row = conn.execute('SELECT id FROM documents WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._remove(conn, row[0])
+            doc_id = conn.execute('INSERT INTO documents (key, name, sentences, tokens, words, added) '
+                                  'VALUES (?, ?, ?, ?, ?, ?)',
+                                  (key, name, stats.sentences, stats.tokens, stats.index.total_words,
+                                   time())).lastrowid
+            for table, counts in frequencies.items():
+                placeholders = ', '.join('?' * (len(frequency_tables[table]) + 2))
+                conn.executemany(f'INSERT INTO doc_{table} VALUES ({placeholders})',
+                                 ((doc_id, *values, count) for values, count in counts.items()))
+                self._update_totals(conn, table, counts.items(), 1)
+        return doc_id
+
+    def add_document(self, tp, name=None):
+        return self.add_stats(CorpusStats().add_document(tp), text_key(tp.store.text), name)
+
+    def remove(self, key):
+        with self._lock, sqlite3.connect(self.path) as conn:
+            row = conn.execute('SELECT id FROM documents WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self._remove(conn, row[0])
+        return row is not None
+
+    def _query(self, sql, params=()):
+        with self._lock, sqlite3.connect(self.path) as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def totals(self):
+        documents, sentences, tokens, words = self._query('SELECT COUNT(*), TOTAL(sentences), TOTAL(tokens), '
+                                                          'TOTAL(words) FROM documents')[0]
+        return {'documents': documents, 'sentences': int(sentences), 'tokens': int(tokens), 'words': int(words)}
+
+    def documents(self):
+        return tuple(self._query('SELECT key, name, sentences, tokens, words FROM documents ORDER BY id'))
+
+    def top_lemmas(self, top=20, pos=None):
+        # (лемма, употреблений, документов)
+        if pos is None:
+            return tuple(self._query('SELECT lemma, count, documents FROM lemmas ORDER BY count DESC LIMIT ?',
+                                     (top,)))
+        return tuple(self._query('SELECT lemma, count, documents FROM pos_lemmas WHERE pos = ? '
+                                 'ORDER BY count DESC LIMIT ?', (pos, top)))
+
+    def top_forms(self, top=20):
+        return tuple(self._query('SELECT form, count, documents FROM forms ORDER BY count DESC LIMIT ?', (top,)))
+
+    def pos_usages(self):
+        return dict(self._query('SELECT pos, count FROM pos'))
+
+    def document_frequency(self, lemma):
+        row = self._query('SELECT documents FROM lemmas WHERE lemma = ?', (lemma,))
+        return row[0][0] if row else 0
+
+    def document_frequencies(self, lemmas):
+        lemmas = tuple(set(lemmas))
+        result = dict.fromkeys(lemmas, 0)
+        # Ограничение SQLite на число параметров запроса
+        for i in range(0, len(lemmas), 500):
+            chunk = lemmas[i:i + 500]
+            result.update(self._query(f'SELECT lemma, documents FROM lemmas WHERE lemma IN '
+                                      f'({", ".join("?" * len(chunk))})', chunk))
+        return result
+
+    def ner_stats(self):
+        counts = dict(self._query('SELECT type, SUM(count) FROM ners GROUP BY type'))
+        return tuple(counts.get(ner_type, 0) for ner_type in ner_types)
+
+    def top_ners(self, top=None):
+        return tuple([tuple(row) for row in self._query('SELECT normal, count FROM ners WHERE type = ? '
+                                                        'ORDER BY count DESC LIMIT ?',
+                                                        (ner_type, -1 if top is None else top))]
+                     for ner_type in ner_types)
+
+    def lemma_weights(self, tp):
+        # TF-IDF лемм документа относительно корпуса; idf сглажен, чтобы новые леммы не давали деления на ноль.
+        # Стоп-слова в веса не попадают, но учитываются в длине документа
+        tp.require('lemma')
+        store = tp.store
+        lemmas = store.lemmas[store.words_mask()].tolist()
+        stopwords = russian_stopwords()
+        counts = Counter(lemma for lemma in (store.lemma_vocab[i] for i in lemmas) if lemma.lower() not in stopwords)
+        total_documents = self.totals()['documents']
+        frequencies = self.document_frequencies(counts.keys())
+        return {lemma: count / len(lemmas) * (log((1 + total_documents) / (1 + frequencies[lemma])) + 1)
+                for lemma, count in counts.items()}
+
+    def keywords(self, tp, top=10):
+        weights = self.lemma_weights(tp)
+        return tuple(sorted(weights.items(), key=lambda x: x[1], reverse=True)[:top])
+
+    def summary(self, top=20):
+        return dict(self.totals(),
+                    pos_usages=self.pos_usages(),
+                    top_lemmas=self.top_lemmas(top),
+                    ner_stats=self.ner_stats(),
+                    top_ners=self.top_ners(top))
@@ -0,0 +1,86 @@
+from collections import Counter, defaultdict
+
+from text_processing import StatsIndex, ner_types, verb_tenses, verb_persons, verb_numbers
+
+
+def safe_compute(compute):
+    # В коротких текстах может не оказаться, например, ни одного прилагательного
+    try:
+        return compute()
+    except (ZeroDivisionError, ValueError):
+        return None
+
+
+class CorpusStats:
+    # Счётчики по одному или нескольким документам, которые можно складывать между собой
+    def __init__(self):
+        self.documents = 0
+        self.sentences = 0
+        self.tokens = 0
+        self.index = StatsIndex()
+        self.ners = defaultdict(Counter)
+
+    def add_tokens(self, tokens):
+        self.tokens += len(tokens)
+        self.index.add_tokens(tokens)
+
+    def add_spans(self, spans):
+        for span in spans:
+            self.ners[span.type][span.normal] += 1
+
+    def add_document(self, tp):
+        # Счётчики берутся из столбцового хранилища: сжатый документ из кэша не разворачивается в Doc
+        tp.require('lemma', 'normalize')
+        store = tp.store
+        self.documents += 1
+        self.sentences += store.sentence_count
+        self.tokens += store.size
+        self.index.merge(tp.index)
+        for type_id, normal_id in zip(store.span_types.tolist(), store.span_normals.tolist()):
+            self.ners[store.type_vocab[type_id]][store.normal_vocab[normal_id]] += 1
+        return self
+
+    def merge(self, other):
+        self.documents += other.documents
+        self.sentences += other.sentences
+        self.tokens += other.tokens
+        self.index.merge(other.index)
+        for ner_type, counter in other.ners.items():
+            self.ners[ner_type].update(counter)
+        return self
+
+    def to_dict(self):
+        return {'documents': self.documents, 'sentences': self.sentences, 'tokens': self.tokens,
+                'index': self.index.to_dict(),
+                'ners': {ner_type: dict(c) for ner_type, c in self.ners.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.documents = data['documents']
+        stats.sentences = data['sentences']
+        stats.tokens = data['tokens']
+        stats.index = StatsIndex.from_dict(data['index'])
+        for ner_type, counts in data['ners'].items():
+            stats.ners[ner_type].update(counts)
+        return stats
+
+    def ner_stats(self):
+        return tuple(sum(self.ners[ner_type].values()) for ner_type in ner_types)
+
+    def top_ners(self, top=None):
+        return tuple(sorted(self.ners[ner_type].items(), key=lambda x: x[1], reverse=True)[:top]
+                     for ner_type in ner_types)
+
+    def summary(self, top=None):
+        return {'documents': self.documents,
+                'sentences': self.sentences,
+                'tokens': self.tokens,
+                'words': self.index.total_words,
+                'pos_freq': safe_compute(self.index.pos_freq),
+                'case_analysis': safe_compute(self.index.case_analysis),
+                'verb_form_analysis_tense': self.index.verb_forms('Tense', verb_tenses),
+                'verb_form_analysis_person': self.index.verb_forms('Person', verb_persons),
+                'verb_form_analysis_number': self.index.verb_forms('Number', verb_numbers),
+                'ner_stats': self.ner_stats(),
+                'top_ners': self.top_ners(top)}
@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+from time import monotonic
+from uuid import uuid4
+
+from wrappers_tp import iter_sections
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, fmt, section_names):
+        self.id = uuid4().hex
+        self.kind = kind
+        self.fmt = fmt
+        self.section_names = tuple(section_names)
+        self.status = 'queued'
+        self.sections = {}
+        self.error = None
+        self.finished_at = None
+        self._cond = Condition()
+
+    def status_view(self):
+        with self._cond:
+            return {'job_id': self.id, 'kind': self.kind, 'status': self.status,
+                    'completed': list(self.sections.keys()),
+                    'pending': [name for name in self.section_names if name not in self.sections],
+                    'error': self.error}
+
+    def set_status(self, status, error=None):
+        with self._cond:
+            self.status = status
+            self.error = error
+            if status in ('done', 'failed'):
+                self.finished_at = monotonic()
+            self._cond.notify_all()
+
+    def set_section(self, name, value):
+        with self._cond:
+            self.sections[name] = value
+            self._cond.notify_all()
+
+    def events(self, heartbeat=15):
+        # Разделы отдаются по мере готовности, в конце - итоговый статус задачи
+        sent = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.sections) > sent or self.finished_at is not None, heartbeat)
+                ready = list(self.sections.items())[sent:]
+                finished = self.finished_at is not None
+            for name, value in ready:
+                yield 'section', {name: value}
+            sent += len(ready)
+            if finished:
+                yield 'status', self.status_view()
+                return
+            if not ready:
+                yield 'heartbeat', {}
+
+
+class JobManager:
+    def __init__(self, analyse, kinds, workers=2, max_pending=32, ttl=600):
+        self.analyse = analyse
+        self.kinds = kinds
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs')
+        self._lock = Lock()
+        self._jobs = {}
+        self.pending = 0
+
+    def submit(self, text, kind, fmt='png'):
+        profile, sections = self.kinds[kind]
+        with self._lock:
+            self._purge()
+            if self.pending >= self.max_pending:
+                raise QueueFull()
+            self.pending += 1
+            job = Job(kind, fmt, sections.keys())
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, text, profile, sections)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, text, profile, sections):
+        job.set_status('running')
+        try:
+            tp = self.analyse(text, profile)
+            for name, value in iter_sections(tp, sections, job.fmt):
+                job.set_section(name, value)
+        except Exception as e:
+            job.set_status('failed', f'{type(e).__name__}: {e}')
+        else:
+            job.set_status('done')
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _purge(self):
+        now = monotonic()
+        expired = tuple(job_id for job_id, job in self._jobs.items()
+                        if job.finished_at is not None and now - job.finished_at > self.ttl)
+        for job_id in expired:
+            del self._jobs[job_id]
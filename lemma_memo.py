@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from threading import Lock
+
+from natasha.const import ORG
+from natasha.norm import inflect_word, recover_shapes, recover_spaces, select_inflectable
+
+eviction_policies = ('lru', 'fifo')
+
+
+def memo_key(word, pos, feats):
+    return word, pos, tuple(sorted(dict(feats or {}).items()))
+
+
+class LemmaMemo:
+    # Общая для всех запросов память лемматизации: (словоформа, часть речи, признаки) -> результат
+    def __init__(self, vocab, max_size=200000, policy='lru'):
+        if policy not in eviction_policies:
+            raise ValueError(f'Unknown eviction policy: {policy}')
+        self.vocab = vocab
+        self.max_size = max_size
+        self.policy = policy
+        self._lock = Lock()
+        self._lemmas = OrderedDict()
+        self._inflections = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size=None, policy=None):
+        if policy is not None and policy not in eviction_policies:
+            raise ValueError(f'Unknown eviction policy: {policy}')
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max_size
+            if policy is not None:
+                self.policy = policy
+            for table in (self._lemmas, self._inflections):
+                self._evict(table)
+
+    def _evict(self, table):
+        while len(table) > self.max_size:
+            table.popitem(last=False)
+
+    def _lookup(self, table, key, compute):
+        with self._lock:
+            if key in table:
+                self.hits += 1
+                if self.policy == 'lru':
+                    table.move_to_end(key)
+                return table[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            table[key] = value
+            self._evict(table)
+        return value
+
+    def lemmatize(self, word, pos, feats):
+        return self._lookup(self._lemmas, memo_key(word, pos, feats),
+                            lambda: self.vocab.lemmatize(word, pos, feats))
+
+    def inflect(self, token):
+        return self._lookup(self._inflections, memo_key(token.text, token.pos, token.feats),
+                            lambda: inflect_word(self.vocab, token))
+
+    def normalize(self, span):
+        # То же, что DocSpan.normalize, но словоформы приводятся к нормальной форме через память
+        tokens = span.tokens
+        ids = set(select_inflectable(tokens)) if span.type == ORG else None
+        words = (self.inflect(token) if not ids or token.id in ids else token.text for token in tokens)
+        span.normal = recover_spaces(recover_shapes(words, tokens), tokens)
+
+    def clear(self):
+        with self._lock:
+            self._lemmas.clear()
+            self._inflections.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'lemmas': len(self._lemmas), 'inflections': len(self._inflections),
+                    'max_size': self.max_size, 'policy': self.policy,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
@@ -0,0 +1,170 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+time_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+size_buckets = (10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+registry = []
+# Разбивка времени текущего запроса по этапам, включается в отладочном режиме
+_breakdown = ContextVar('breakdown', default=None)
+
+
+def format_labels(names, values, extra=()):
+    pairs = tuple(zip(names, values)) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in pairs) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+        self._values = {}
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        with self._lock:
+            return tuple((self.name, key, (), value) for key, value in self._values.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, key, extra, value in self.samples():
+            lines.append(f'{name}{format_labels(self.labels, key, extra)} {format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        super().__init__(name, help, labels)
+        # collect() -> {(значения меток): значение}, вызывается при каждом чтении /metrics
+        self.collect = collect
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.collect is not None:
+            with self._lock:
+                self._values = dict(self.collect())
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=time_buckets):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = tuple((key, tuple(counts), total) for key, (counts, total) in self._values.items())
+        result = []
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                result.append((self.name + '_bucket', key, (('le', bound),), count))
+            result.append((self.name + '_sum', key, (), total))
+            result.append((self.name + '_count', key, (), counts[-1]))
+        return tuple(result)
+
+
+def process_memory():
+    # Резидентная память и её часть, отображённая из файлов (в том числе mmap моделей); только Linux
+    try:
+        with open('/proc/self/statm') as f:
+            resident, shared = (int(v) for v in f.read().split()[1:3])
+    except OSError:
+        return {}
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    memory = {('resident',): resident * page_size, ('shared',): shared * page_size}
+    # Pss делит общие страницы между процессами, использующими их: это честная оценка памяти одного рабочего процесса
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    memory['proportional',] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+def render_all():
+    return '\n'.join(metric.render() for metric in registry) + '\n'
+
+
+def start_breakdown():
+    breakdown = {}
+    return breakdown, _breakdown.set(breakdown)
+
+
+def stop_breakdown(token):
+    _breakdown.reset(token)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            key = ':'.join((histogram.name,) + tuple(str(v) for v in labels.values()))
+            breakdown[key] = breakdown.get(key, 0) + elapsed
+
+
+startup_seconds = Gauge('text_stats_startup_seconds', 'Время запуска процесса по фазам', ('phase',))
+process_memory_bytes = Gauge('text_stats_process_memory_bytes', 'Память процесса', ('kind',), collect=process_memory)
+model_load_seconds = Gauge('text_stats_model_load_seconds', 'Время загрузки модели', ('model',))
+stage_seconds = Histogram('text_stats_stage_seconds', 'Время этапа конвейера NLP', ('stage',))
+document_tokens = Histogram('text_stats_document_tokens', 'Размер документа в токенах', buckets=size_buckets)
+document_sentences = Histogram('text_stats_document_sentences', 'Размер документа в предложениях',
+                               buckets=size_buckets)
+tagger_batch_items = Histogram('text_stats_tagger_batch_items', 'Число предложений в общем вызове теггера',
+                               ('model',), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+tagger_batch_wait_seconds = Histogram('text_stats_tagger_batch_wait_seconds', 'Ожидание общего вызова теггера',
+                                      ('model',))
+section_seconds = Histogram('text_stats_section_seconds', 'Время подготовки раздела ответа', ('section',))
+chart_render_seconds = Histogram('text_stats_chart_render_seconds', 'Время отрисовки графика', ('type', 'format'))
+serialization_seconds = Histogram('text_stats_serialization_seconds', 'Время сериализации ответа в JSON',
+                                  ('route',))
+request_seconds = Histogram('text_stats_request_seconds', 'Полное время обработки запроса', ('route',))
+requests_total = Counter('text_stats_requests_total', 'Число запросов', ('route', 'status'))
@@ -0,0 +1,137 @@
+import os
+import warnings
+from threading import RLock
+from time import perf_counter
+
+import numpy as np
+from navec import Navec
+from navec.meta import Meta
+from navec.navec import META, VOCAB
+from navec.pq import PQ
+from navec.tar import Tar
+from navec.vocab import Vocab
+
+from lemma_memo import LemmaMemo
+from metrics import model_load_seconds
+from natasha import MorphVocab, Segmenter, NewsMorphTagger, NewsNERTagger, NewsSyntaxParser
+from natasha.data import NEWS_EMBEDDING
+
+# Модели загружаются один раз на процесс и переиспользуются всеми документами
+_lock = RLock()
+_models = {}
+# Каталог с массивами моделей в формате .npy, которые открываются через mmap
+model_cache_dir = os.environ.get('TEXT_STATS_MODEL_CACHE',
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'text-stats-rus'))
+
+
+def _load(name, factory):
+    model = _models.get(name)
+    if model is None:
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                start = perf_counter()
+                model = factory()
+                model_load_seconds.set(perf_counter() - start, model=name)
+                _models[name] = model
+    return model
+
+
+class MappedPQ(PQ):
+    # Квантованные векторы navec вместе с заранее посчитанными norm и ab, которые иначе считаются в каждом процессе
+    def __init__(self, vectors, dim, qdim, centroids, indexes, codes, norm, ab):
+        self.norm = norm
+        self.ab = ab
+        super().__init__(vectors, dim, qdim, centroids, indexes, codes)
+
+    def precompute(self):
+        self.qdims = np.arange(self.qdim)
+
+
+def mapped_arrays(source, names, extract):
+    # Массивы извлекаются из архива модели один раз и дальше открываются только для чтения через mmap:
+    # страницы файла общие для всех рабочих процессов и не копируются при fork
+    stat = os.stat(source)
+    directory = os.path.join(model_cache_dir, f'{os.path.basename(source)}-{stat.st_size}-{int(stat.st_mtime)}')
+    paths = {name: os.path.join(directory, name + '.npy') for name in names}
+    if not all(os.path.exists(path) for path in paths.values()):
+        os.makedirs(directory, exist_ok=True)
+        for name, array in extract().items():
+            temp_path = f'{paths[name]}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(temp_path, paths[name])
+    return {name: np.load(path, mmap_mode='r') for name, path in paths.items()}
+
+
+def load_embedding(path=NEWS_EMBEDDING):
+    def extract():
+        pq = Navec.load(path).pq
+        return {'indexes': pq.indexes, 'codes': pq.codes, 'norm': pq.norm, 'ab': pq.ab}
+
+    try:
+        arrays = mapped_arrays(path, ('indexes', 'codes', 'norm', 'ab'), extract)
+    except OSError as e:
+        # Без доступного для записи каталога кэша модель загружается целиком в память процесса
+        warnings.warn(f'Каталог {model_cache_dir} недоступен ({e}), массивы эмбеддингов загружаются в память')
+        return Navec.load(path)
+    with Tar(path) as tar:
+        meta = Meta.from_file(tar.load(META))
+        vocab = Vocab.from_file(tar.load(VOCAB))
+    vectors, qdim = arrays['indexes'].shape
+    qdim, centroids, subdim = arrays['codes'].shape
+    return Navec(meta, vocab, MappedPQ(vectors, qdim * subdim, qdim, centroids, **arrays))
+
+
+def share_vocab(tagger):
+    # Словари слов всех теггеров совпадают со словарём эмбеддингов: одна копия на процесс вместо четырёх
+    words_vocab, vocab = tagger.infer.encoder.words_vocab, get_embedding().vocab
+    if words_vocab.items == vocab.words:
+        words_vocab.items, words_vocab.item_ids = vocab.words, vocab.word_ids
+    return tagger
+
+
+def get_segmenter():
+    return _load('segmenter', Segmenter)
+
+
+def get_morph_vocab():
+    return _load('morph_vocab', MorphVocab)
+
+
+def get_embedding():
+    return _load('embedding', load_embedding)
+
+
+def get_morph_tagger():
+    return _load('morph_tagger', lambda: share_vocab(NewsMorphTagger(get_embedding())))
+
+
+def get_syntax_parser():
+    return _load('syntax_parser', lambda: share_vocab(NewsSyntaxParser(get_embedding())))
+
+
+def get_ner_tagger():
+    return _load('ner_tagger', lambda: share_vocab(NewsNERTagger(get_embedding())))
+
+
+def get_lemma_memo():
+    return _load('lemma_memo', lambda: LemmaMemo(get_morph_vocab()))
+
+
+loaders = {'segmenter': get_segmenter,
+           'morph_vocab': get_morph_vocab,
+           'embedding': get_embedding,
+           'morph_tagger': get_morph_tagger,
+           'syntax_parser': get_syntax_parser,
+           'ner_tagger': get_ner_tagger,
+           'lemma_memo': get_lemma_memo}
+
+
+def warm_up(names=None):
+    for name in (loaders.keys() if names is None else names):
+        loaders[name]()
+
+
+def loaded_models():
+    return tuple(_models.keys())
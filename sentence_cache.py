@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+
+from natasha.doc import DocToken, DocSent, DocSpan, envelop_span_tokens
+
+from batching import get_tagger
+from models import get_lemma_memo
+
+# Этапы, которые выполняются по отдельным предложениям и запоминаются
+sentence_stages = ('morph', 'lemma', 'syntax', 'ner', 'normalize')
+
+
+def sentence_key(sent):
+    return sha1(sent.text.encode('utf-8')).hexdigest()
+
+
+def _local_id(token_id):
+    return token_id.rsplit('_', 1)[-1]
+
+
+def detached_sentence(sent):
+    # Копия предложения со смещениями относительно его начала
+    tokens = [DocToken(t.start - sent.start, t.stop - sent.start, t.text) for t in sent.tokens]
+    return DocSent(0, sent.stop - sent.start, sent.text, tokens)
+
+
+def analyse_sentences(sents, stages, records=None):
+    # Разбор набора предложений одним вызовом каждого нужного теггера; stages должны включать свои зависимости.
+    # records - уже сохранённые записи предложений: их этапы не повторяются, а результаты переносятся на токены,
+    # чтобы на них опирались следующие этапы. Результат - дополненные записи для кэша:
+    # {этап: значения по токенам или именованные сущности предложения}
+    sents = [detached_sentence(sent) for sent in sents]
+    records = [dict(record) for record in records] if records is not None else [{} for _ in sents]
+    for sent, record in zip(sents, records):
+        apply_record(sent, 1, record, record.keys())
+
+    def missing(stage):
+        return [i for i, record in enumerate(records) if stage in stages and stage not in record]
+
+    todo = missing('morph')
+    if todo:
+        markups = get_tagger('morph_tagger').map([[t.text for t in sents[i].tokens] for i in todo])
+        for i, markup in zip(todo, markups):
+            for token, source in zip(sents[i].tokens, markup.tokens):
+                token.pos, token.feats = source.pos, source.feats
+            records[i]['morph'] = tuple((t.pos, t.feats) for t in sents[i].tokens)
+    lemma_memo = get_lemma_memo()
+    for i in missing('lemma'):
+        for token in sents[i].tokens:
+            token.lemma = lemma_memo.lemmatize(token.text, token.pos, token.feats)
+        records[i]['lemma'] = tuple(t.lemma for t in sents[i].tokens)
+    todo = missing('syntax')
+    if todo:
+        markups = get_tagger('syntax_parser').map([[t.text for t in sents[i].tokens] for i in todo])
+        for i, markup in zip(todo, markups):
+            for token, source in zip(sents[i].tokens, markup.tokens):
+                token.id, token.head_id, token.rel = source.id, source.head_id, source.rel
+            records[i]['syntax'] = tuple((_local_id(t.id), _local_id(t.head_id), t.rel) for t in sents[i].tokens)
+    todo = missing('ner')
+    if todo:
+        texts = [sents[i].text for i in todo]
+        markups = get_tagger('ner_tagger').map(texts) if any(text.strip() for text in texts) else \
+            ([] for _ in texts)
+        for i, markup in zip(todo, markups):
+            records[i]['ner'] = tuple((s.start, s.stop, s.type) for s in getattr(markup, 'spans', ()))
+    for i in missing('normalize'):
+        sent = sents[i]
+        spans = [DocSpan(start, stop, span_type, sent.text[start:stop])
+                 for start, stop, span_type in records[i]['ner']]
+        envelop_span_tokens(sent.tokens, spans)
+        for span in spans:
+            lemma_memo.normalize(span)
+        records[i]['normalize'] = tuple(s.normal for s in spans)
+    return records
+
+
+def apply_record(sent, sent_id, record, stages):
+    # Переносит результаты этапов stages из записи на токены предложения документа
+    for i, token in enumerate(sent.tokens):
+        if 'morph' in stages:
+            token.pos, feats = record['morph'][i]
+            token.feats = dict(feats)
+        if 'lemma' in stages:
+            token.lemma = record['lemma'][i]
+        if 'syntax' in stages:
+            local_id, head_id, token.rel = record['syntax'][i]
+            token.id = f'{sent_id}_{local_id}'
+            token.head_id = f'{sent_id}_{head_id}'
+
+
+class SentenceCache:
+    # Результаты разбора отдельных предложений по хешу их текста: после правки текста
+    # через теггеры проходят только изменённые предложения
+    def __init__(self, max_sentences=50000):
+        self.max_sentences = max_sentences
+        self._lock = Lock()
+        self._records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key, stages):
+        with self._lock:
+            record = self._records.get(key)
+            if record is None or not stages <= record.keys():
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._records.move_to_end(key)
+            return record or {}
+
+    def _store(self, key, record):
+        with self._lock:
+            # Новые этапы добавляются к уже сохранённым; записи не изменяются на месте
+            self._records[key] = {**self._records.get(key, {}), **record}
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_sentences:
+                self._records.popitem(last=False)
+
+    def analyse(self, doc, stages=sentence_stages):
+        # Запись предложения дополняется этапами по мере того, как их запрашивают
+        stages = frozenset(stages)
+        keys = [sentence_key(sent) for sent in doc.sents]
+        records = [self._lookup(key, stages) for key in keys]
+        # Повторяющиеся внутри документа предложения размечаются один раз
+        missing = {}
+        for i, (key, record) in enumerate(zip(keys, records)):
+            if not stages <= record.keys():
+                missing.setdefault(key, i)
+        if missing:
+            analysed = dict(zip(missing, analyse_sentences([doc.sents[i] for i in missing.values()], stages,
+                                                           [records[i] for i in missing.values()])))
+            for key, record in analysed.items():
+                self._store(key, record)
+            records = [analysed.get(key, record) for key, record in zip(keys, records)]
+        for sent_id, (sent, record) in enumerate(zip(doc.sents, records), 1):
+            apply_record(sent, sent_id, record, stages)
+        if 'ner' in stages:
+            doc.spans = []
+            for sent, record in zip(doc.sents, records):
+                normals = record['normalize'] if 'normalize' in stages else (None,) * len(record['ner'])
+                for (start, stop, span_type), normal in zip(record['ner'], normals):
+                    start, stop = start + sent.start, stop + sent.start
+                    doc.spans.append(DocSpan(start, stop, span_type, doc.text[start:stop], normal=normal))
+            doc.envelop_span_tokens()
+            doc.envelop_sent_spans()
+        return len(missing)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'sentences': len(self._records), 'max_sentences': self.max_sentences,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0}
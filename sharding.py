@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+from threading import Lock
+
+from natasha import Doc
+from natasha.doc import DocToken, DocSent, DocSpan
+
+import batching
+from models import warm_up
+from sentence_cache import sentence_stages, _local_id
+from text_processing import pipeline_stages
+
+
+def _init_worker():
+    # В рабочем процессе теггеры вызываются напрямую: объединять вызовы там не с кем
+    batching.configure(0)
+    warm_up()
+
+
+def analyse_shard(text, sents, stages=sentence_stages):
+    # text - фрагмент документа от начала первого до конца последнего предложения шарда,
+    # sents - (start, stop, ((start, stop), ...)) со смещениями относительно начала фрагмента,
+    # stages - нужные этапы вместе с зависимостями
+    doc = Doc(text)
+    doc.sents, doc.tokens = [], []
+    for start, stop, bounds in sents:
+        tokens = [DocToken(token_start, token_stop, text[token_start:token_stop])
+                  for token_start, token_stop in bounds]
+        doc.sents.append(DocSent(start, stop, text[start:stop], tokens))
+        doc.tokens.extend(tokens)
+    # Те же функции этапов, что и для целого документа; NER размечает весь фрагмент, а не отдельные предложения
+    for stage in sentence_stages:
+        if stage in stages:
+            pipeline_stages[stage][1](doc)
+    tokens = tuple((t.pos, t.feats, t.lemma, t.id and _local_id(t.id), t.head_id and _local_id(t.head_id), t.rel)
+                   for t in doc.tokens)
+    spans = tuple((s.start, s.stop, s.type, s.normal) for s in doc.spans or ())
+    return tokens, spans
+
+
+class ShardPool:
+    # Разбор одного большого документа на нескольких ядрах: предложения делятся на шарды,
+    # которые разбираются в пуле процессов с загруженными моделями и собираются обратно в исходный Doc
+    def __init__(self, workers=None, min_sentences=400, min_shard_sentences=50):
+        self.workers = workers or os.cpu_count()
+        self.min_sentences = min_sentences
+        self.min_shard_sentences = min_shard_sentences
+        self._lock = Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _executor(self):
+        # Пул создаётся при первом большом документе и заново в каждом процессе после fork
+        # (например, в рабочих процессах gunicorn --preload): очереди пула нельзя делить между процессами
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Пул создаётся из потока запроса, когда уже работают потоки планировщиков, графиков и заданий:
+                # fork такого процесса может унаследовать захваченные блокировки, поэтому рабочие процессы
+                # запускаются через forkserver и загружают модели сами в _init_worker
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 mp_context=multiprocessing.get_context('forkserver'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def accepts(self, doc):
+        return doc.sents is not None and len(doc.sents) >= self.min_sentences
+
+    def shards(self, doc):
+        # Шардов в несколько раз больше, чем процессов, чтобы неравные по длине шарды не оставляли ядра без работы
+        size = max(self.min_shard_sentences, ceil(len(doc.sents) / (self.workers * 4)))
+        return [doc.sents[i:i + size] for i in range(0, len(doc.sents), size)]
+
+    def analyse(self, doc, stages=sentence_stages):
+        shards = self.shards(doc)
+        pool = self._executor()
+        futures = []
+        for sents in shards:
+            offset = sents[0].start
+            futures.append(pool.submit(
+                analyse_shard, doc.text[offset:sents[-1].stop],
+                tuple((s.start - offset, s.stop - offset, tuple((t.start - offset, t.stop - offset) for t in s.tokens))
+                      for s in sents), tuple(stages)))
+        if 'ner' in stages:
+            doc.spans = []
+        sent_id = 0
+        for sents, future in zip(shards, futures):
+            tokens, spans = future.result()
+            offset = sents[0].start
+            records = iter(tokens)
+            # Номера предложений в идентификаторах синтаксиса заменяются сквозными номерами документа
+            for sent in sents:
+                sent_id += 1
+                for token, (pos, feats, lemma, local_id, head_id, rel) in zip(sent.tokens, records):
+                    # Переносятся только выполненные этапы: остальные поля токена остаются пустыми
+                    if 'morph' in stages:
+                        token.pos, token.feats = pos, feats
+                    if 'lemma' in stages:
+                        token.lemma = lemma
+                    if 'syntax' in stages:
+                        token.rel = rel
+                        token.id = f'{sent_id}_{local_id}'
+                        token.head_id = f'{sent_id}_{head_id}'
+            for start, stop, span_type, normal in spans:
+                start, stop = start + offset, stop + offset
+                doc.spans.append(DocSpan(start, stop, span_type, doc.text[start:stop], normal=normal))
+        if 'ner' in stages:
+            doc.envelop_span_tokens()
+            doc.envelop_sent_spans()
+        return len(shards)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,117 @@
+import argparse
+import json
+
+from corpus_stats import CorpusStats
+from models import get_segmenter
+from text_processing import TextProcessing, verb_tenses, verb_persons, verb_numbers
+
+
+def read_chunks(path, encoding='utf-8', chunk_size=64 * 1024):
+    with open(path, encoding=encoding) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def sentence_batches(chunks, batch_size=200, max_batch_chars=256 * 1024, max_sentence_chars=16 * 1024):
+    # Последнее предложение буфера может быть не закончено, поэтому оно ждёт следующего куска текста.
+    # Текст без границ предложений режется по пробелу, как только буфер превышает max_sentence_chars,
+    # а пачка отдаётся и по числу предложений, и по числу символов: иначе память росла бы вместе с текстом
+    segmenter = get_segmenter()
+    buffer = ''
+    batch = []
+    batch_chars = 0
+    for chunk in chunks:
+        buffer += chunk
+        sents = list(segmenter.sentenize(buffer))
+        if len(sents) >= 2:
+            batch.extend(s.text for s in sents[:-1])
+            batch_chars += sents[-1].start
+            buffer = buffer[sents[-1].start:]
+        while len(buffer) > max_sentence_chars:
+            cut = buffer.rfind(' ', 0, max_sentence_chars) + 1 or max_sentence_chars
+            batch.append(buffer[:cut].strip())
+            batch_chars += cut
+            buffer = buffer[cut:]
+        if len(batch) >= batch_size or batch_chars >= max_batch_chars:
+            yield '\n'.join(batch)
+            batch = []
+            batch_chars = 0
+    batch.extend(s.text for s in segmenter.sentenize(buffer))
+    if batch:
+        yield '\n'.join(batch)
+
+
+class StreamingAnalysis:
+    # Токены каждой пачки предложений сразу сворачиваются в счётчики и отбрасываются,
+    # так что память растёт только вместе со словарём текста
+    def __init__(self, ner=True):
+        self.ner = ner
+        self.stats = CorpusStats()
+        self.stats.documents = 1
+        self.batches = 0
+
+    def feed(self, text):
+        tp = TextProcessing(text, stages=('lemma', 'normalize') if self.ner else ('lemma',))
+        self.stats.sentences += len(tp.doc.sents)
+        self.stats.add_tokens(tp.doc.tokens)
+        if self.ner:
+            self.stats.add_spans(tp.doc.spans)
+        self.batches += 1
+
+    def feed_all(self, chunks, batch_size=200):
+        for batch in sentence_batches(chunks, batch_size):
+            self.feed(batch)
+        return self
+
+    def avg_sent_len(self):
+        return round(self.stats.tokens / self.stats.sentences)
+
+    def total_word_usages(self):
+        return self.stats.index.total_words
+
+    def total_lemma_usages(self):
+        return self.stats.tokens
+
+    def pos_freq_compute(self):
+        return self.stats.index.pos_freq()
+
+    def case_analysis(self):
+        return self.stats.index.case_analysis()
+
+    def verb_form_analysis_tense(self):
+        return self.stats.index.verb_forms('Tense', verb_tenses)
+
+    def verb_form_analysis_person(self):
+        return self.stats.index.verb_forms('Person', verb_persons)
+
+    def verb_form_analysis_number(self):
+        return self.stats.index.verb_forms('Number', verb_numbers)
+
+    def ner_stats(self):
+        return self.stats.ner_stats()
+
+    def top_ners(self):
+        return self.stats.top_ners()
+
+
+def analyse_file(path, batch_size=200, ner=True, encoding='utf-8'):
+    return StreamingAnalysis(ner).feed_all(read_chunks(path, encoding), batch_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Анализ большого текста по частям с ограниченной памятью')
+    parser.add_argument('path')
+    parser.add_argument('-b', '--batch-size', type=int, default=200, help='предложений в одной пачке')
+    parser.add_argument('--no-ner', action='store_true', help='не выделять именованные сущности')
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+    analysis = analyse_file(args.path, args.batch_size, not args.no_ner, args.encoding)
+    print(json.dumps(analysis.stats.summary(args.top), ensure_ascii=False, indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Общий для тестов текст: несколько предложений с именованными сущностями всех типов
+sample_text = ('Мэр Москвы Сергей Собянин открыл новую станцию метро. Пассажиры смогут пользоваться ею '
+               'с завтрашнего дня. Строительство заняло три года. Компания «Мосинжпроект» выполнила работы в срок.')
+
+
+def doc_signature(tp):
+    # Разметка токенов и именованных сущностей документа для сравнения разных путей разбора
+    return ([(t.pos, t.feats, t.lemma, t.id, t.head_id, t.rel) for t in tp.doc.tokens],
+            [(s.start, s.stop, s.type, s.normal) for s in tp.doc.spans or ()])
+
+
+@pytest.fixture
+def text():
+    return sample_text
+
+
+@pytest.fixture
+def signature():
+    return doc_signature
@@ -0,0 +1,42 @@
+import pytest
+
+import app as app_module
+from app import app, analysis_cache
+from corpus_index import CorpusIndex
+
+
+def test_sections_without_ner_skip_syntax_and_ner(text):
+    response = app.test_client().post('/process?sections=pos_stat_table', data=text.encode('utf-8'))
+    assert response.status_code == 200
+    # Профиль по умолчанию включает кэш предложений: он тоже не должен запускать лишние этапы
+    done_stages = analysis_cache.get(text).done_stages
+    assert 'ner' not in done_stages
+    assert 'syntax' not in done_stages
+
+
+@pytest.mark.parametrize('path', ['/corpus?top=abc', '/corpus?top=-1', '/corpus/keywords?text&top=abc'])
+def test_invalid_top_is_rejected(monkeypatch, tmp_path, path):
+    monkeypatch.setattr(app_module, 'corpus_index', CorpusIndex(str(tmp_path / 'corpus.db')))
+    response = app.test_client().get(path)
+    assert response.status_code == 400
+    assert 'top' in response.get_json()['info_field']
+
+
+@pytest.mark.parametrize('body', [{'text': 5}, {'text': ['текст']}, [1]])
+@pytest.mark.parametrize('path', ['/process', '/morph', '/jobs'])
+def test_non_string_text_is_rejected(path, body):
+    response = app.test_client().post(path, json=body)
+    assert response.status_code == 400
+    assert response.get_json()['info_field']
+
+
+@pytest.mark.parametrize('options', [{'offset': None}, {'offset': [1]}, {'limit': {}}, {'offset': 'abc'}])
+def test_invalid_morph_paging_is_rejected(text, options):
+    response = app.test_client().post('/morph', json=dict(options, text=text))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('sections', [5, {'pos_stat_table': True}, [1]])
+def test_invalid_sections_type_is_rejected(text, sections):
+    response = app.test_client().post('/process', json={'text': text, 'sections': sections})
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import batching
+from batching import MicroBatcher
+
+
+class RecordingModel:
+    # Возвращает элементы как есть и запоминает размеры вызовов
+    def __init__(self, started=None, release=None):
+        self.batch_size = 8
+        self.calls = []
+        self.started = started
+        self.release = release
+
+    def map(self, items):
+        self.calls.append(list(items))
+        if self.release is not None and len(self.calls) == 1:
+            self.started.set()
+            self.release.wait()
+        return iter(items)
+
+
+def test_batches_never_exceed_max_batch_size(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setitem(batching.loaders, 'recording', lambda: model)
+    batcher = MicroBatcher('recording', max_batch_size=4, max_wait=0)
+    try:
+        items = [f'item{i}' for i in range(11)]
+        assert list(batcher.map(items)) == items
+    finally:
+        batcher.stop()
+    assert [len(call) for call in model.calls] == [4, 4, 3]
+
+
+def test_slices_are_interleaved_between_callers(monkeypatch):
+    started, release = Event(), Event()
+    model = RecordingModel(started, release)
+    monkeypatch.setitem(batching.loaders, 'recording', lambda: model)
+    batcher = MicroBatcher('recording', max_batch_size=4, max_wait=0)
+    try:
+        with ThreadPoolExecutor(3) as executor:
+            # Первый вызов занимает модель, пока в очередь встают большой и маленький запросы
+            first = executor.submit(lambda: list(batcher.map(['warm'])))
+            started.wait()
+            large_items = [f'large{i}' for i in range(12)]
+            large = executor.submit(lambda: list(batcher.map(large_items)))
+            while batcher.pending < 1:
+                pass
+            small = executor.submit(lambda: list(batcher.map(['small0', 'small1'])))
+            while batcher.pending < 2:
+                pass
+            release.set()
+            assert first.result() == ['warm']
+            assert large.result() == large_items
+            assert small.result() == ['small0', 'small1']
+    finally:
+        batcher.stop()
+    assert all(len(call) <= 4 for call in model.calls)
+    # Маленький запрос попадает во второй пакет, а не ждёт, пока разберут весь большой
+    assert 'small0' in model.calls[1] + model.calls[2]
+    assert model.calls[-1][-1].startswith('large')
@@ -0,0 +1,50 @@
+from cache import AnalysisCache, SqliteBackend, estimate_size, text_key
+from sentence_cache import SentenceCache
+from wrappers_tp import HtmlTP
+
+texts = ('Первый текст для кэша.', 'Второй текст для кэша.', 'Третий текст для кэша.')
+
+
+def no_factory(text):
+    raise AssertionError('документ должен браться из кэша')
+
+
+def test_least_recently_used_entry_is_evicted_by_size():
+    size = max(estimate_size(HtmlTP(text, profile='minimal').compact()) for text in texts)
+    cache = AnalysisCache(HtmlTP, max_bytes=size * 2)
+    first = cache.get(texts[0], profile='minimal')
+    cache.get(texts[1], profile='minimal')
+    assert cache.get(texts[0]) is first
+    cache.get(texts[2], profile='minimal')
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['entries'] == 2
+    assert stats['bytes'] <= size * 2
+    # Вытеснен второй текст: к первому обращались позже
+    assert cache.get(texts[0]) is first
+    misses = cache.stats()['misses']
+    cache.get(texts[1])
+    assert cache.stats()['misses'] == misses + 1
+
+
+def test_document_is_loaded_from_disk(tmp_path, text):
+    backend = SqliteBackend(str(tmp_path / 'cache.db'))
+    AnalysisCache(HtmlTP, backend=backend).get(text, profile='morph')
+    cache = AnalysisCache(no_factory, backend=backend)
+    tp = cache.get(text)
+    assert cache.stats()['disk_hits'] == 1
+    assert tp.done_stages == {'segment', 'morph', 'lemma'}
+    assert tp.summary() == HtmlTP(text, profile='morph').summary()
+
+
+def test_disk_document_is_extended_with_sentence_cache(tmp_path, text, signature):
+    backend = SqliteBackend(str(tmp_path / 'cache.db'))
+    AnalysisCache(HtmlTP, backend=backend).get(text, profile='morph')
+    sentence_cache = SentenceCache()
+    cache = AnalysisCache(no_factory, backend=backend, restore=lambda tp: tp.attach(sentence_cache))
+    tp = cache.get(text, profile='full')
+    # Недостающие этапы загруженного документа разбираются через подключённый заново кэш предложений
+    assert sentence_cache.misses > 0
+    assert signature(tp) == signature(HtmlTP(text, profile='full'))
+    # Дополненный документ сохраняется на диск
+    assert backend.load(text_key(text)).done_stages == set(tp.done_stages)
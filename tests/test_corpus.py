@@ -0,0 +1,25 @@
+from collections import Counter, defaultdict
+
+from corpus_index import CorpusIndex
+from corpus_stats import CorpusStats
+from text_processing import russian_stopwords
+from wrappers_tp import HtmlTP
+
+
+def test_compact_document_stays_compact(text):
+    tp = HtmlTP(text, profile='full').compact()
+    stats = CorpusStats().add_document(tp)
+    assert tp.is_compact
+    doc = HtmlTP(text, profile='full').doc
+    ners = defaultdict(Counter)
+    for span in doc.spans:
+        ners[span.type][span.normal] += 1
+    assert (stats.sentences, stats.tokens, stats.ners) == (len(doc.sents), len(doc.tokens), ners)
+
+
+def test_keywords_skip_stopwords(text, tmp_path):
+    index = CorpusIndex(str(tmp_path / 'corpus.db'))
+    index.add_document(HtmlTP('Работы по строительству метро идут в Москве.', profile='full'))
+    keywords = [lemma for lemma, _ in index.keywords(HtmlTP(text, profile='summary'), top=50)]
+    assert keywords
+    assert not set(keywords) & russian_stopwords()
@@ -0,0 +1,12 @@
+import pytest
+from navec.pq import PQ
+
+import models
+
+
+def test_unwritable_model_cache_falls_back_to_memory(monkeypatch):
+    monkeypatch.setattr(models, 'model_cache_dir', '/proc/text-stats')
+    with pytest.warns(UserWarning, match='/proc/text-stats'):
+        embedding = models.load_embedding()
+    assert type(embedding.pq) is PQ
+    assert embedding['мэр'].shape == (300,)
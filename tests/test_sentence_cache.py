@@ -0,0 +1,72 @@
+from collections import Counter
+
+import pytest
+
+import sentence_cache
+from sentence_cache import SentenceCache
+from wrappers_tp import HtmlTP
+
+
+@pytest.mark.parametrize('profile', ['morph', 'summary', 'ner', 'full'])
+def test_profile_with_sentence_cache(profile, text, signature):
+    cached = HtmlTP(text, profile=profile, sentence_cache=SentenceCache())
+    plain = HtmlTP(text, profile=profile)
+    assert cached.done_stages == plain.done_stages
+    assert signature(cached) == signature(plain)
+
+
+def test_light_profile_skips_syntax_and_ner(text):
+    tp = HtmlTP(text, profile='morph', sentence_cache=SentenceCache())
+    assert tp.done_stages == {'segment', 'morph', 'lemma'}
+    assert all(t.rel is None for t in tp.doc.tokens)
+    assert tp.doc.spans is None
+
+
+def test_record_is_extended_with_new_stages(text, signature):
+    cache = SentenceCache()
+    HtmlTP(text, profile='morph', sentence_cache=cache)
+    misses = cache.misses
+    # Недостающие этапы дописываются к записи
+    tp = HtmlTP(text, profile='full', sentence_cache=cache)
+    assert cache.misses > misses
+    assert signature(tp) == signature(HtmlTP(text, profile='full'))
+    hits = cache.hits
+    HtmlTP(text, profile='full', sentence_cache=cache)
+    assert cache.hits > hits
+
+
+@pytest.fixture
+def tagger_calls(monkeypatch):
+    # Число вызовов map каждого теггера при разборе через кэш предложений
+    calls = Counter()
+
+    class CountingTagger:
+        def __init__(self, name, tagger):
+            self.name, self.tagger = name, tagger
+
+        def map(self, items):
+            calls[self.name] += 1
+            return self.tagger.map(items)
+
+    def get_tagger(name, get_tagger=sentence_cache.get_tagger):
+        return CountingTagger(name, get_tagger(name))
+
+    monkeypatch.setattr(sentence_cache, 'get_tagger', get_tagger)
+    return calls
+
+
+def test_full_profile_calls_each_tagger_once(text, tagger_calls):
+    HtmlTP(text, profile='full', sentence_cache=SentenceCache())
+    assert tagger_calls == {'morph_tagger': 1, 'syntax_parser': 1, 'ner_tagger': 1}
+
+
+def test_cached_stages_are_not_tagged_again(text, tagger_calls, signature):
+    cache = SentenceCache()
+    HtmlTP(text, profile='morph', sentence_cache=cache)
+    assert tagger_calls == {'morph_tagger': 1}
+    # Морфология для нормализации берётся из записи предложения
+    tp = HtmlTP(text, profile='full', sentence_cache=cache)
+    assert tagger_calls == {'morph_tagger': 1, 'syntax_parser': 1, 'ner_tagger': 1}
+    assert signature(tp) == signature(HtmlTP(text, profile='full'))
+    HtmlTP(text, profile='full', sentence_cache=cache)
+    assert tagger_calls == {'morph_tagger': 1, 'syntax_parser': 1, 'ner_tagger': 1}
@@ -0,0 +1,40 @@
+import pytest
+
+from sharding import ShardPool
+from wrappers_tp import HtmlTP
+
+
+@pytest.fixture(scope='module')
+def shard_pool():
+    pool = ShardPool(1, min_sentences=2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize('profile', ['morph', 'summary', 'ner', 'full'])
+def test_profile_with_shard_pool(shard_pool, profile, text):
+    # Этапы запрашиваются до сегментации: пул должен выбираться только после неё
+    sharded = HtmlTP(text, profile=profile, shard_pool=shard_pool)
+    plain = HtmlTP(text, profile=profile)
+    assert sharded.summary() == plain.summary()
+
+
+def test_shards_match_single_process(shard_pool, text, signature):
+    sharded = HtmlTP(text, profile='full', shard_pool=shard_pool)
+    plain = HtmlTP(text, profile='full')
+    assert signature(sharded) == signature(plain)
+    assert sharded.top_ners() == plain.top_ners()
+
+
+def test_light_profile_skips_syntax_and_ner(shard_pool, text, signature):
+    sharded = HtmlTP(text, profile='morph', shard_pool=shard_pool)
+    assert sharded.done_stages == {'segment', 'morph', 'lemma'}
+    assert signature(sharded) == signature(HtmlTP(text, profile='morph'))
+
+
+def test_full_profile_is_sharded_once(shard_pool, text, monkeypatch):
+    calls = []
+    analyse = shard_pool.analyse
+    monkeypatch.setattr(shard_pool, 'analyse', lambda doc, stages: calls.append(stages) or analyse(doc, stages))
+    HtmlTP(text, profile='full', shard_pool=shard_pool)
+    assert calls == [{'morph', 'lemma', 'syntax', 'ner', 'normalize'}]
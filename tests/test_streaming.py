@@ -0,0 +1,15 @@
+from streaming import sentence_batches
+
+
+def test_text_without_sentence_breaks_is_split():
+    chunks = ['слово ' * 10000] * 30
+    batches = list(sentence_batches(chunks, max_batch_chars=256 * 1024, max_sentence_chars=16 * 1024))
+    assert len(batches) > 1
+    # Пачка может превысить лимит не больше чем на последний прочитанный кусок и отрезок буфера
+    assert max(len(batch) for batch in batches) <= 256 * 1024 + len(chunks[0]) + 16 * 1024
+    assert ' '.join(batches).split() == ''.join(chunks).split()
+
+
+def test_sentences_are_kept_whole(text):
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+    assert list(sentence_batches(chunks)) == list(sentence_batches([text]))
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from text_processing import StatsIndex
+from wrappers_tp import HtmlTP
+
+bench_corpus = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench_corpus.txt')
+
+
+@pytest.fixture(params=['sample', 'bench'])
+def document(request, text):
+    if request.param == 'bench':
+        with open(bench_corpus, encoding='utf-8') as f:
+            return f.read()
+    return text
+
+
+def index_state(index):
+    return {name: dict(value) for name, value in vars(index).items()}
+
+
+def test_index_from_store_matches_token_walk(document):
+    tp = HtmlTP(document, profile='full')
+    from_store = StatsIndex.from_store(tp.store)
+    from_tokens = StatsIndex(tp.doc.tokens)
+    assert index_state(from_store) == index_state(from_tokens)
+    # Порядок словоформ влияет на порядок строк в таблицах с равными частотами
+    assert list(from_store.token_forms) == list(from_tokens.token_forms)
+    assert list(from_store.word_forms) == list(from_tokens.word_forms)
+
+
+@pytest.mark.parametrize('profile', ['minimal', 'morph', 'ner', 'full'])
+def test_compact_round_trip(document, profile, signature):
+    tp = HtmlTP(document, profile=profile)
+    expected = signature(tp), [(s.start, s.stop, s.text) for s in tp.doc.sents]
+    tp.compact()
+    assert tp.is_compact
+    assert (signature(tp), [(s.start, s.stop, s.text) for s in tp.doc.sents]) == expected
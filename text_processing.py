@@ -1,8 +1,16 @@
 from itertools import chain
 from heapq import nlargest
-from natasha import MorphVocab, Segmenter, NewsMorphTagger, NewsEmbedding, Doc, NewsNERTagger, NewsSyntaxParser
-from nltk.corpus import stopwords
-from collections import Counter
+import numpy as np
+from natasha import Doc
+from collections import Counter, defaultdict
+from functools import lru_cache
+from threading import RLock
+
+from batching import get_tagger
+from metrics import timed, stage_seconds, document_tokens, document_sentences
+from models import get_segmenter, get_lemma_memo
+from sentence_cache import sentence_stages
+from token_store import TokenStore
 
 parts_of_speech = {('NOUN',): 'Существительное', ('VERB',): 'Глагол', ('ADJ',): 'Прилагательное',
                    ('PART', 'AUX',): 'Частица', ('PROPN',): 'Имя собственное', ('DET', 'PRON',): 'Местоимение',
@@ -21,7 +29,21 @@ cases_translation = {'Nom': 'Именительный',
                      'Ins': 'Творительный',
                      'Loc': 'Предложный', }
 cases = cases_translation.keys()
-sw_filter = lambda lst: tuple(filter(lambda x: str(x).lower() not in stopwords.words('russian'), lst))
+verb_tenses = ('Past', 'Pres', 'Fut')
+verb_persons = ('1', '2', '3')
+verb_numbers = ('Sing', 'Plur')
+ner_types = ('PER', 'LOC', 'ORG')
+# Группы токенов, для которых ведётся подсчёт морфологических признаков
+feature_groups = {'NOUN': 'nouns', 'PROPN': 'nouns', 'ADJ': 'adjs', 'VERB': 'verbs'}
+
+
+@lru_cache(maxsize=None)
+def russian_stopwords():
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('russian'))
+
+
+sw_filter = lambda lst: tuple(filter(lambda x: str(x).lower() not in russian_stopwords(), lst))
 
 
 def pos_name_to_rus(pos, plural=False):
@@ -31,82 +53,408 @@ def pos_name_to_rus(pos, plural=False):
     return 'Неизвестно'
 
 
+def _segment(doc):
+    doc.segment(get_segmenter())
+
+
+def _tag_morph(doc):
+    doc.tag_morph(get_tagger('morph_tagger'))
+
+
+def _lemmatize(doc):
+    lemma_memo = get_lemma_memo()
+    for token in doc.tokens:
+        token.lemma = lemma_memo.lemmatize(token.text, token.pos, token.feats)
+
+
+def _parse_syntax(doc):
+    doc.parse_syntax(get_tagger('syntax_parser'))
+
+
+def _tag_ner(doc):
+    doc.tag_ner(get_tagger('ner_tagger'))
+
+
+def _normalize_spans(doc):
+    lemma_memo = get_lemma_memo()
+    for span in doc.spans:
+        lemma_memo.normalize(span)
+
+
+class StatsIndex:
+    # Все счётчики строятся за один проход по doc.tokens; индексы можно дополнять и объединять
+    def __init__(self, tokens=()):
+        self.token_forms = Counter()
+        self.word_forms = Counter()
+        self.token_lemmas = defaultdict(Counter)
+        self.word_lemmas = defaultdict(Counter)
+        self.pos_usages = Counter()
+        self.group_sizes = Counter()
+        self.feature_counts = defaultdict(Counter)
+        self.add_tokens(tokens)
+
+    def add_tokens(self, tokens):
+        for token in tokens:
+            self.token_forms[token.text] += 1
+            self.token_lemmas[token.pos][token.lemma] += 1
+            if token.pos not in ('X', 'PUNCT'):
+                self.word_forms[token.text] += 1
+                self.word_lemmas[token.pos][token.lemma] += 1
+                self.pos_usages[token.pos] += 1
+            group = feature_groups.get(token.pos)
+            if group is not None:
+                self.group_sizes[group] += 1
+                for feature, value in dict(token.feats).items():
+                    self.feature_counts[group, feature][value] += 1
+
+    def merge(self, other):
+        self.token_forms.update(other.token_forms)
+        self.word_forms.update(other.word_forms)
+        self.pos_usages.update(other.pos_usages)
+        self.group_sizes.update(other.group_sizes)
+        for target, source in ((self.token_lemmas, other.token_lemmas),
+                               (self.word_lemmas, other.word_lemmas),
+                               (self.feature_counts, other.feature_counts)):
+            for key, counter in source.items():
+                target[key].update(counter)
+        return self
+
+    def to_dict(self):
+        return {'token_forms': dict(self.token_forms),
+                'word_forms': dict(self.word_forms),
+                'token_lemmas': {pos: dict(c) for pos, c in self.token_lemmas.items()},
+                'word_lemmas': {pos: dict(c) for pos, c in self.word_lemmas.items()},
+                'pos_usages': dict(self.pos_usages),
+                'group_sizes': dict(self.group_sizes),
+                'feature_counts': {f'{group}|{feature}': dict(c)
+                                   for (group, feature), c in self.feature_counts.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.token_forms.update(data['token_forms'])
+        index.word_forms.update(data['word_forms'])
+        index.pos_usages.update(data['pos_usages'])
+        index.group_sizes.update(data['group_sizes'])
+        for pos, counts in data['token_lemmas'].items():
+            index.token_lemmas[pos].update(counts)
+        for pos, counts in data['word_lemmas'].items():
+            index.word_lemmas[pos].update(counts)
+        for key, counts in data['feature_counts'].items():
+            index.feature_counts[tuple(key.split('|', 1))].update(counts)
+        return index
+
+    @classmethod
+    def from_store(cls, store):
+        # Подсчёт по столбцам хранилища; словоформы идут в порядке первого появления, как при проходе по токенам
+        index = cls()
+        words = store.words_mask()
+        for target, forms in ((index.token_forms, store.forms), (index.word_forms, store.forms[words])):
+            ids, first, counts = np.unique(forms, return_index=True, return_counts=True)
+            for i in np.argsort(first, kind='stable'):
+                target[store.form_vocab[ids[i]]] = int(counts[i])
+        lemma_count = len(store.lemma_vocab)
+        for target, mask in ((index.token_lemmas, slice(None)), (index.word_lemmas, words)):
+            pairs = store.pos[mask].astype(np.int64) * lemma_count + store.lemmas[mask]
+            ids, counts = np.unique(pairs, return_counts=True)
+            for pair, count in zip(ids.tolist(), counts.tolist()):
+                pos, lemma = divmod(pair, lemma_count)
+                target[store.pos_vocab[pos]][store.lemma_vocab[lemma]] = count
+        pos_counts = np.bincount(store.pos[words], minlength=len(store.pos_vocab))
+        for pos, count in enumerate(pos_counts.tolist()):
+            if count:
+                index.pos_usages[store.pos_vocab[pos]] = count
+        groups = defaultdict(list)
+        for pos, group in feature_groups.items():
+            groups[group].append(pos)
+        for group, poses in groups.items():
+            mask = store.pos_mask(*poses)
+            index.group_sizes[group] = int(mask.sum())
+            tag_counts = np.bincount(store.tags[mask], minlength=len(store.tag_vocab))
+            for tag in np.flatnonzero(tag_counts):
+                for feature, value in store.tag_vocab[tag]:
+                    index.feature_counts[group, feature][value] += int(tag_counts[tag])
+        return index
+
+    @property
+    def all_token_lemmas(self):
+        return set(chain(*self.token_lemmas.values()))
+
+    @property
+    def all_word_lemmas(self):
+        return set(chain(*self.word_lemmas.values()))
+
+    @property
+    def word_lemma_freqs(self):
+        return sum(self.word_lemmas.values(), Counter())
+
+    @property
+    def total_words(self):
+        return sum(self.pos_usages.values())
+
+    def unique_words_count(self, pos=None):
+        return len(self.all_word_lemmas if pos is None else self.word_lemmas.get(pos, ()))
+
+    def feature_count(self, group, feature, value):
+        return self.feature_counts[group, feature][value]
+
+    def pos_freq(self):
+        total_words = self.total_words
+        total_unique_words = self.unique_words_count()
+        tokens_by_poses = []
+        for pos in chain(*parts_of_speech.keys()):
+            absolute_words_usages = self.pos_usages[pos]
+            if absolute_words_usages != 0:
+                relative_word_usages = round((absolute_words_usages / total_words) * 100)
+                pos_translated = pos_name_to_rus(pos, True)
+                absolute_unique_words = self.unique_words_count(pos)
+                relative_unique_words = round((absolute_unique_words / total_unique_words) * 100)
+                tokens_by_poses.append((absolute_words_usages, relative_word_usages,
+                                        pos, pos_translated,
+                                        absolute_unique_words, relative_unique_words))
+        return tuple(tokens_by_poses)
+
+    def case_analysis(self):
+        total_nouns = self.group_sizes['nouns']
+        total_adjs = self.group_sizes['adjs']
+        result = []
+        for case in cases:
+            abs_nouns = self.feature_count('nouns', 'Case', case)
+            abs_adj = self.feature_count('adjs', 'Case', case)
+            rel_nouns = abs_nouns / total_nouns
+            rel_nouns = round(rel_nouns * 100)
+            rel_adj = abs_adj / total_adjs
+            rel_adj = round(100 * rel_adj)
+            abs_sum = abs_nouns + abs_adj
+            rel_sum = round((abs_sum / (total_adjs + total_nouns)) * 100)
+            result.append((case,
+                           abs_nouns, rel_nouns,
+                           abs_adj, rel_adj,
+                           abs_sum, rel_sum))
+        return tuple(result)
+
+    def verb_forms(self, feature, values):
+        return tuple((value, self.feature_count('verbs', feature, value)) for value in values)
+
+
+# Этапы конвейера: название -> (зависимости, функция)
+# Нормализация организаций идёт по синтаксическому дереву, поэтому зависит от syntax
+pipeline_stages = {'segment': ((), _segment),
+                   'morph': (('segment',), _tag_morph),
+                   'lemma': (('morph',), _lemmatize),
+                   'syntax': (('segment',), _parse_syntax),
+                   'ner': (('segment',), _tag_ner),
+                   'normalize': (('ner', 'morph', 'syntax'), _normalize_spans)}
+# Наборы этапов, которые можно запросить заранее
+profiles = {'full': tuple(pipeline_stages.keys()),
+            'morph': ('lemma',),
+            'summary': ('lemma',),
+            'ner': ('normalize',),
+            'minimal': ('segment',)}
+
+
+def stage_closure(*stages):
+    # Этапы вместе со всеми их зависимостями
+    closure = set()
+    for stage in stages:
+        if stage not in closure:
+            closure.add(stage)
+            closure |= stage_closure(*pipeline_stages[stage][0])
+    return closure
+
+
 class TextProcessing:
-    def __init__(self, text):
-        self.doc = Doc(text)
-        self.doc.segment(Segmenter())
-        self.doc.tag_morph(NewsMorphTagger(NewsEmbedding()))
-        morph_vocab = MorphVocab()
-        for token in self.doc.tokens:
-            token.lemmatize(morph_vocab)
-        self.doc.parse_syntax(NewsSyntaxParser(NewsEmbedding()))
-        self.doc.tag_ner(NewsNERTagger(NewsEmbedding()))
-        for span in self.doc.spans:
-            span.normalize(morph_vocab)
-        self.words = tuple(filter(lambda x: x.pos not in ('X', 'PUNCT'), self.doc.tokens))
-        self.tokens_nouns = tuple(filter(lambda t: t.pos in ['NOUN', 'PROPN'], self.doc.tokens))
-        self.tokens_adjs = tuple(filter(lambda t: t.pos == 'ADJ', self.doc.tokens))
-        self.tokens_verbs = tuple(filter(lambda t: t.pos == 'VERB', self.doc.tokens))
+    def __init__(self, text, profile=None, stages=(), sentence_cache=None, shard_pool=None):
+        self._doc = Doc(text)
+        self._store = None
+        # С кэшем предложений или пулом шардов этапы после сегментации выполняются за один проход
+        # по предложениям вместе со своими зависимостями; пул берёт большие документы, кэш - остальные
+        self.sentence_cache = sentence_cache
+        self.shard_pool = shard_pool
+        self.done_stages = set()
+        self._lock = RLock()
+        self._words = None
+        self._tokens_nouns = None
+        self._tokens_adjs = None
+        self._tokens_verbs = None
+        self._index = None
+        if profile is not None:
+            stages = tuple(stages) + profiles[profile]
+        self.require(*stages)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_index'] = None
+        state['sentence_cache'] = state['shard_pool'] = None
+        # Сохраняется только компактное хранилище, объекты Doc восстанавливаются из него при необходимости
+        if state['_store'] is not None and state['_store'].stages == self.done_stages:
+            state.update(_doc=None, _words=None, _tokens_nouns=None, _tokens_adjs=None, _tokens_verbs=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = RLock()
+
+    def attach(self, sentence_cache=None, shard_pool=None):
+        # Кэш предложений и пул шардов не сохраняются вместе с документом и подключаются заново после загрузки
+        self.sentence_cache = sentence_cache
+        self.shard_pool = shard_pool
+        return self
+
+    def require(self, *stages):
+        with self._lock:
+            stages = [stage for stage in stages if stage not in self.done_stages]
+            needed = stage_closure(*stages).intersection(sentence_stages)
+            if not needed <= self.done_stages and (self.sentence_cache is not None or self.shard_pool is not None):
+                # Выбор между пулом шардов и кэшем предложений зависит от числа предложений
+                self.require('segment')
+                analyser = self._sentence_analyser()
+                if analyser is not None:
+                    # Все запрошенные этапы вместе с зависимостями - за один проход по предложениям
+                    with timed(stage_seconds, stage='shards' if analyser is self.shard_pool else 'sentences'):
+                        analyser.analyse(self.doc, needed)
+                    self.done_stages.update(needed)
+            for stage in stages:
+                if stage in self.done_stages:
+                    continue
+                depends, run = pipeline_stages[stage]
+                self.require(*depends)
+                with timed(stage_seconds, stage=stage):
+                    run(self.doc)
+                self.done_stages.add(stage)
+                if stage == 'segment':
+                    document_tokens.observe(len(self.doc.tokens))
+                    document_sentences.observe(len(self.doc.sents))
+
+    def _sentence_analyser(self):
+        if self.shard_pool is not None and self.shard_pool.accepts(self.doc):
+            return self.shard_pool
+        return self.sentence_cache
+
+    @property
+    def doc(self):
+        doc = self._doc
+        if doc is None:
+            with self._lock:
+                if self._doc is None:
+                    self._doc = self._store.to_doc()
+                doc = self._doc
+        return doc
+
+    @property
+    def store(self):
+        self.require('segment')
+        with self._lock:
+            if self._store is None or self._store.stages != self.done_stages:
+                self._store = TokenStore(self.doc, self.done_stages)
+            return self._store
+
+    @property
+    def is_compact(self):
+        return self._doc is None
+
+    def compact(self):
+        # Оставляет только столбцовое хранилище; объекты Doc будут восстановлены, если понадобятся
+        store = self.store
+        with self._lock:
+            if store.stages == self.done_stages:
+                self._doc = None
+                self._words = self._tokens_nouns = self._tokens_adjs = self._tokens_verbs = None
+        return self
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.require('lemma')
+            with self._lock:
+                if self._index is None:
+                    self._index = StatsIndex.from_store(self.store)
+        return self._index
+
+    @property
+    def words(self):
+        if self._words is None:
+            self.require('morph')
+            self._words = tuple(filter(lambda x: x.pos not in ('X', 'PUNCT'), self.doc.tokens))
+        return self._words
+
+    @property
+    def tokens_nouns(self):
+        if self._tokens_nouns is None:
+            self.require('morph')
+            self._tokens_nouns = tuple(filter(lambda t: t.pos in ['NOUN', 'PROPN'], self.doc.tokens))
+        return self._tokens_nouns
+
+    @property
+    def tokens_adjs(self):
+        if self._tokens_adjs is None:
+            self.require('morph')
+            self._tokens_adjs = tuple(filter(lambda t: t.pos == 'ADJ', self.doc.tokens))
+        return self._tokens_adjs
+
+    @property
+    def tokens_verbs(self):
+        if self._tokens_verbs is None:
+            self.require('morph')
+            self._tokens_verbs = tuple(filter(lambda t: t.pos == 'VERB', self.doc.tokens))
+        return self._tokens_verbs
 
     def unique_lemmas(self, pos=None):
         if pos is None:
-            return tuple(set(dt.lemma for dt in self.doc.tokens))
+            return tuple(self.index.all_token_lemmas)
         else:
-            return tuple(set(dt.lemma for dt in filter(lambda dt: dt.pos == pos, self.doc.tokens)))
+            return tuple(self.index.token_lemmas.get(pos, ()))
 
     def unique_words(self, pos=None):
         if pos is None:
-            return tuple(set(dt.lemma for dt in self.words))
+            return tuple(self.index.all_word_lemmas)
         else:
-            return tuple(set(dt.lemma for dt in filter(lambda dt: dt.pos == pos, self.words)))
+            return tuple(self.index.word_lemmas.get(pos, ()))
 
     def word_usages(self):
         return tuple(dt.text for dt in self.words)
 
     def token_usages(self):
+        self.require('segment')
         return tuple(dt.text for dt in self.doc.tokens)
 
     def unique_word_usages(self):
-        return tuple(set(self.word_usages()))
+        return tuple(self.index.word_forms.keys())
 
     def unique_token_usages(self):
-        return tuple(set(self.token_usages()))
+        return tuple(self.index.token_forms.keys())
 
     def omonyms_freq_compute(self, include_stopwords=True):
-        wu = self.word_usages() if include_stopwords else sw_filter(self.word_usages())
-        wu_repeats = {i: wu.count(i) for i in wu}
+        wu_repeats = self.index.word_forms.items()
+        if not include_stopwords:
+            wu_repeats = filter(lambda case: case[0].lower() not in russian_stopwords(), wu_repeats)
+        # Знаменатель - все слова: sw_filter(self.words) сравнивает repr токенов и ничего не отбрасывает
+        total = self.index.total_words
         res = []
-        for case in wu_repeats.items():
+        for case in wu_repeats:
             absolute = case[1]
             if absolute > 1:
-                relative = round((absolute / len(self.words if include_stopwords else sw_filter(self.words))) * 100)
+                relative = round((absolute / total) * 100)
                 text = case[0]
                 res.append((text, absolute, relative))
         return tuple(res)
 
+    def total_sentences(self):
+        return self.store.sentence_count
+
     def avg_sent_len(self):
-        return round(sum(map(lambda s: len(s.tokens), self.doc.sents)) / len(self.doc.sents))
+        store = self.store
+        return round(int(store.sent_offsets[-1] - store.sent_offsets[0]) / store.sentence_count)
 
     def total_word_usages(self):
-        return len(self.words)
+        return self.index.total_words
 
     def total_lemma_usages(self):
-        return len(self.doc.tokens)
+        return self.store.size
 
     def pos_freq_compute(self):
-        tokens_by_poses = []
-        for pos in chain(*parts_of_speech.keys()):
-            words_of_pos = tuple(filter(lambda dt: dt.pos == pos, self.words))
-            absolute_words_usages = len(words_of_pos)
-            if absolute_words_usages != 0:
-                relative_word_usages = round((absolute_words_usages / len(self.words)) * 100)
-                pos_translated = pos_name_to_rus(pos, True)
-                absolute_unique_words = len(self.unique_words(pos))
-                relative_unique_words = round((absolute_unique_words / len(self.unique_words())) * 100)
-                tokens_by_poses.append((absolute_words_usages, relative_word_usages,
-                                        pos, pos_translated,
-                                        absolute_unique_words, relative_unique_words))
-        return tuple(tokens_by_poses)
+        return self.index.pos_freq()
 
     def nouns_adj_by_cases(self):
         nouns = tuple(filter(lambda t: 'Case' in dict(t.feats).keys(), self.tokens_nouns))
@@ -116,69 +464,57 @@ class TextProcessing:
                       tuple(filter(lambda t: t.feats['Case'] == case, adjs))) for case in cases)
 
     def case_analysis(self):
-        nabc = self.nouns_adj_by_cases()
-        result = []
-        for i, case in enumerate(cases):
-            abs_nouns = len(nabc[i][1])
-            abs_adj = len(nabc[i][2])
-            rel_nouns = abs_nouns / len(self.tokens_nouns)
-            rel_nouns = round(rel_nouns * 100)
-            rel_adj = abs_adj / len(self.tokens_adjs)
-            rel_adj = round(100 * rel_adj)
-            abs_sum = abs_nouns + abs_adj
-            rel_sum = round((abs_sum / (len(self.tokens_adjs) + len(self.tokens_nouns))) * 100)
-            result.append((case,
-                           abs_nouns, rel_nouns,
-                           abs_adj, rel_adj,
-                           abs_sum, rel_sum))
-        return tuple(result)
+        return self.index.case_analysis()
 
     def verb_form_analysis_tense(self):
-        verbs = tuple(filter(lambda t: 'Tense' in dict(t.feats).keys(), self.tokens_verbs))
-        return tuple((tense, len(tuple(filter(lambda t: t.feats['Tense'] == tense, verbs))))
-                     for tense in ('Past', 'Pres', 'Fut'))
+        return self.index.verb_forms('Tense', verb_tenses)
 
     def verb_form_analysis_person(self):
-        verbs = tuple(filter(lambda t: 'Person' in dict(t.feats).keys(), self.tokens_verbs))
-        return tuple((p, len(tuple(filter(lambda t: t.feats['Person'] == p, verbs))))
-                     for p in ('1', '2', '3'))
+        return self.index.verb_forms('Person', verb_persons)
 
     def verb_form_analysis_number(self):
-        verbs = tuple(filter(lambda t: 'Number' in dict(t.feats).keys(), self.tokens_verbs))
-        return tuple((p, len(tuple(filter(lambda t: t.feats['Number'] == p, verbs))))
-                     for p in ('Sing', 'Plur'))
+        return self.index.verb_forms('Number', verb_numbers)
 
-    def simple_summarization(self, top=None):
+    def simple_summarization(self, top=None, weights=None):
+        # weights - веса лемм вместо частот внутри документа, например TF-IDF из CorpusIndex.lemma_weights
+        self.require('lemma')
+        store = self.store
         if top is None:
-            top = len(self.doc.sents) * 0.20
+            top = store.sentence_count * 0.20
             if top < 1:
                 top = 1
             else:
                 top = round(top)
-        words = sw_filter(self.words)
-        lemma_frequencies = {}
-        for word in words:
-            if word.lemma not in lemma_frequencies.keys():
-                lemma_frequencies[word.lemma] = 1
-            else:
-                lemma_frequencies[word.lemma] += 1
-        max_frequency = max(lemma_frequencies.values())
+        # sw_filter(self.words) сравнивает repr токенов, поэтому учитываются все слова
+        if weights is None:
+            lemma_frequencies = np.bincount(store.lemmas[store.words_mask()],
+                                            minlength=len(store.lemma_vocab)).tolist()
+        else:
+            lemma_frequencies = [weights.get(lemma, 0) for lemma in store.lemma_vocab.items]
+        max_frequency = max(lemma_frequencies)
+        lemmas = store.lemmas.tolist()
+        offsets = store.sent_offsets.tolist()
         sent_scores = {}
-        for sentence in self.doc.sents:
+        for i in range(store.sentence_count):
             # Cумма относительных частот словоупотреблений для каждого предложения текста
-            sent_scores[sentence.text] = sum(tuple(lemma_frequencies[word.lemma] / max_frequency
-                                                   for word in filter(lambda w: w.lemma in lemma_frequencies.keys(),
-                                                                      sentence.tokens)))
+            sent_scores[store.sentence_text(i)] = sum(tuple(lemma_frequencies[lemma] / max_frequency
+                                                            for lemma in lemmas[offsets[i]:offsets[i + 1]]
+                                                            if lemma_frequencies[lemma]))
         summary_sentences = nlargest(top, sent_scores.items(), key=lambda item: item[1])
         return tuple(t for t, _ in summary_sentences)
 
     def ner_stats(self):
-        return (len(tuple(filter(lambda s: s.type == 'PER', self.doc.spans))),
-                len(tuple(filter(lambda s: s.type == 'LOC', self.doc.spans))),
-                len(tuple(filter(lambda s: s.type == 'ORG', self.doc.spans))))
+        self.require('ner')
+        store = self.store
+        return tuple(int(np.count_nonzero(store.span_types == store.type_vocab.get(ner_type, -1)))
+                     for ner_type in ner_types)
 
     def top_ners(self):
-        pers = dict(Counter(tuple(map(lambda s: s.normal, filter(lambda s: s.type == 'PER', self.doc.spans)))))
-        locs = dict(Counter(tuple(map(lambda s: s.normal, filter(lambda s: s.type == 'LOC', self.doc.spans)))))
-        orgs = dict(Counter(tuple(map(lambda s: s.normal, filter(lambda s: s.type == 'ORG', self.doc.spans)))))
-        return sorted(pers.items(), key=lambda x: x[1], reverse=True), sorted(locs.items(), key=lambda x: x[1], reverse=True), sorted(orgs.items(),key=lambda x: x[1], reverse=True)
+        self.require('normalize')
+        store = self.store
+        result = []
+        for ner_type in ner_types:
+            normals = store.span_normals[store.span_types == store.type_vocab.get(ner_type, -1)]
+            counts = dict(Counter(store.normal_vocab[i] for i in normals.tolist()))
+            result.append(sorted(counts.items(), key=lambda x: x[1], reverse=True))
+        return tuple(result)
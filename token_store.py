@@ -0,0 +1,163 @@
+import numpy as np
+from natasha import Doc
+from natasha.doc import DocToken, DocSent, DocSpan
+
+
+class Vocabulary:
+    # Интернирование значений: каждое значение хранится один раз, в столбцах - только номера
+    def __init__(self, items=()):
+        self.items = []
+        self._ids = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        item_id = self._ids.get(item)
+        if item_id is None:
+            item_id = len(self.items)
+            self._ids[item] = item_id
+            self.items.append(item)
+        return item_id
+
+    def get(self, item, default=None):
+        return self._ids.get(item, default)
+
+    def encode(self, items, dtype=np.int32):
+        return np.fromiter((self.add(item) for item in items), dtype=dtype)
+
+    def __getitem__(self, item_id):
+        return self.items[item_id]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getstate__(self):
+        return self.items
+
+    def __setstate__(self, items):
+        self.__init__(items)
+
+
+def _local_id(token_id):
+    return int(token_id.rsplit('_', 1)[1])
+
+
+class TokenStore:
+    # Столбцовое представление разобранного документа: числовые массивы NumPy вместо объектов DocToken
+    def __init__(self, doc, stages):
+        self.text = doc.text
+        self.stages = frozenset(stages)
+        tokens = doc.tokens
+        self.size = len(tokens)
+        self.bounds = np.array([(t.start, t.stop) for t in tokens], dtype=np.int32).reshape(-1, 2)
+        self.form_vocab = Vocabulary()
+        self.forms = self.form_vocab.encode(t.text for t in tokens)
+        self.sent_bounds = np.array([(s.start, s.stop) for s in doc.sents], dtype=np.int32).reshape(-1, 2)
+        self.sent_offsets = np.cumsum([0] + [len(s.tokens) for s in doc.sents], dtype=np.int32)
+        self.pos_vocab = self.tag_vocab = self.lemma_vocab = self.rel_vocab = None
+        self.span_bounds = self.span_types = self.span_normals = self.type_vocab = self.normal_vocab = None
+        if 'morph' in self.stages:
+            self.pos_vocab = Vocabulary()
+            self.pos = self.pos_vocab.encode((t.pos for t in tokens), np.int16)
+            # Признаки хранятся целым набором в исходном порядке, чтобы при восстановлении совпасть с feats
+            self.tag_vocab = Vocabulary()
+            self.tags = self.tag_vocab.encode(tuple((t.feats or {}).items()) for t in tokens)
+        if 'lemma' in self.stages:
+            self.lemma_vocab = Vocabulary()
+            self.lemmas = self.lemma_vocab.encode(t.lemma for t in tokens)
+        if 'syntax' in self.stages:
+            self.rel_vocab = Vocabulary()
+            self.local_ids = np.fromiter((_local_id(t.id) for t in tokens), dtype=np.int32, count=self.size)
+            self.heads = np.fromiter((_local_id(t.head_id) for t in tokens), dtype=np.int32, count=self.size)
+            self.rels = self.rel_vocab.encode((t.rel for t in tokens), np.int16)
+        if 'ner' in self.stages:
+            spans = doc.spans
+            self.span_bounds = np.array([(s.start, s.stop) for s in spans], dtype=np.int32).reshape(-1, 2)
+            self.type_vocab = Vocabulary()
+            self.span_types = self.type_vocab.encode((s.type for s in spans), np.int8)
+            if 'normalize' in self.stages:
+                self.normal_vocab = Vocabulary()
+                self.span_normals = self.normal_vocab.encode(s.normal for s in spans)
+
+    @property
+    def nbytes(self):
+        arrays = tuple(v for v in self.__dict__.values() if isinstance(v, np.ndarray))
+        vocabularies = tuple(v for v in self.__dict__.values() if isinstance(v, Vocabulary))
+        # Строки словарей оцениваются грубо: по 64 байта на элемент
+        return len(self.text) * 2 + sum(a.nbytes for a in arrays) + sum(len(v) * 64 for v in vocabularies)
+
+    @property
+    def sentence_count(self):
+        return len(self.sent_bounds)
+
+    def pos_ids(self, *poses):
+        return tuple(filter(lambda i: i is not None, (self.pos_vocab.get(pos) for pos in poses)))
+
+    def pos_mask(self, *poses):
+        return np.isin(self.pos, self.pos_ids(*poses))
+
+    def words_mask(self):
+        return ~self.pos_mask('X', 'PUNCT')
+
+    def feature_values(self, feature):
+        # Значение признака для каждого набора признаков; None, если признака в наборе нет
+        return tuple(dict(tag).get(feature) for tag in self.tag_vocab.items)
+
+    def sentence_text(self, i):
+        start, stop = self.sent_bounds[i]
+        return self.text[start:stop]
+
+    def span_text(self, i):
+        start, stop = self.span_bounds[i]
+        return self.text[start:stop]
+
+    def token(self, i):
+        start, stop = (int(v) for v in self.bounds[i])
+        token = DocToken(start, stop, self.text[start:stop])
+        if self.pos_vocab is not None:
+            token.pos = self.pos_vocab[self.pos[i]]
+            token.feats = dict(self.tag_vocab[self.tags[i]])
+        if self.lemma_vocab is not None:
+            token.lemma = self.lemma_vocab[self.lemmas[i]]
+        return token
+
+    def to_doc(self):
+        doc = Doc(self.text)
+        doc.tokens = [self.token(i) for i in range(self.size)]
+        doc.sents = []
+        for i, (start, stop) in enumerate(self.sent_bounds.tolist()):
+            sent = DocSent(start, stop, self.text[start:stop])
+            sent.tokens = doc.tokens[self.sent_offsets[i]:self.sent_offsets[i + 1]]
+            if self.rel_vocab is not None:
+                for j in range(self.sent_offsets[i], self.sent_offsets[i + 1]):
+                    token = doc.tokens[j]
+                    token.id = f'{i + 1}_{self.local_ids[j]}'
+                    token.head_id = f'{i + 1}_{self.heads[j]}'
+                    token.rel = self.rel_vocab[self.rels[j]]
+            doc.sents.append(sent)
+        if self.type_vocab is not None:
+            doc.spans = []
+            for i, (start, stop) in enumerate(self.span_bounds.tolist()):
+                span = DocSpan(start, stop, self.type_vocab[self.span_types[i]], self.text[start:stop])
+                if self.normal_vocab is not None:
+                    span.normal = self.normal_vocab[self.span_normals[i]]
+                doc.spans.append(span)
+            doc.envelop_span_tokens()
+            doc.envelop_sent_spans()
+        return doc
+
+
+class StoreTokens:
+    # Последовательность токенов хранилища; объекты DocToken создаются только при обращении
+    def __init__(self, store, indices):
+        self.store = store
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        return self.store.token(int(self.indices[i]))
+
+    def __iter__(self):
+        return (self.store.token(int(i)) for i in self.indices)
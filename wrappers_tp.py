@@ -1,8 +1,12 @@
-import base64
 from copy import deepcopy
-from io import BytesIO
-import matplotlib.pyplot as plt
+from itertools import islice
+
+import numpy as np
+
+from charts import renderer, bar_chart, pie_chart, fig_to_html
+from metrics import timed, section_seconds
 from text_processing import TextProcessing, pos_name_to_rus, cases_translation
+from token_store import StoreTokens
 
 td = lambda s: f'<td>{s}</td>'
 p = lambda s: f'<p>{s}</p>'
@@ -50,13 +54,15 @@ translation_values = {
 translation_values_aspect = {
     'Imp': 'Несовершенный',
     'Perf': 'Совершенный'}
-
-
-def fig_to_html(fig):
-    tempfile = BytesIO()
-    fig.savefig(tempfile, format='png')
-    encoded = base64.b64encode(tempfile.getvalue()).decode('utf-8')
-    return '<img class="img img-fluid" src=\'data:image/png;base64,{}\'>'.format(encoded)
+morph_table_head = '''<table class="table">\n<thead><tr>\n
+      <th scope="col">#</th>
+      <th scope="col">Словоупотребление</th>
+      <th scope="col">Часть речи</th>
+      <th scope="col">Начальная форма(лемма)</th>
+      <th scope="col">Прочие характеристики</th>
+    </tr>
+  </thead> <tbody>'''
+morph_table_tail = '</tbody> </table>'
 
 
 def table_to_html(headings, data):
@@ -86,33 +92,52 @@ def translate_features(feats):
 
 
 class HtmlTP(TextProcessing):
-    def __init__(self, text):
-        super().__init__(text)
+    def __init__(self, text, profile=None, stages=(), sentence_cache=None, shard_pool=None):
+        super().__init__(text, profile, stages, sentence_cache, shard_pool)
 
-    def morhp_analysis(self, pos=None, include_punct=False):
-        tokens = self.doc.tokens if include_punct else self.words
+    def morph_tokens(self, pos=None, include_punct=False):
+        self.require('lemma')
+        store = self.store
+        mask = np.ones(store.size, dtype=bool) if include_punct else store.words_mask()
         if pos is not None:
-            tokens = filter(lambda dt: dt.pos == pos, tokens)
-        # generating html code
-        result = '''<table class="table">\n<thead><tr>\n
-      <th scope="col">#</th>
-      <th scope="col">Словоупотребление</th>
-      <th scope="col">Часть речи</th>
-      <th scope="col">Начальная форма(лемма)</th>
-      <th scope="col">Прочие характеристики</th>
-    </tr>
-  </thead> <tbody>'''
-        for i, token in enumerate(tokens):
+            mask &= store.pos_mask(pos)
+        return StoreTokens(store, np.flatnonzero(mask))
+
+    def morph_rows(self, pos=None, include_punct=False, offset=0, limit=None):
+        tokens = self.morph_tokens(pos, include_punct)
+        stop = len(tokens) if limit is None else min(offset + limit, len(tokens))
+        for i in range(offset, stop):
+            token = tokens[i]
             # preparing features
             feats = translate_features(token.feats)
             feats_s = ',<br>'.join(tuple(f'{k}: {v.lower()}' for k, v in feats.items()))
-            result += f'<tr><th scope="row">{i + 1}</th>{td(token.text)}{td(pos_name_to_rus(token.pos) + f" ({token.pos})")}{td(token.lemma)}{td(feats_s)}</tr>'
-        result += '</tbody> </table>'
-        return result
+            yield f'<tr><th scope="row">{i + 1}</th>{td(token.text)}{td(pos_name_to_rus(token.pos) + f" ({token.pos})")}{td(token.lemma)}{td(feats_s)}</tr>'
+
+    def morph_records(self, pos=None, include_punct=False, offset=0, limit=None):
+        tokens = self.morph_tokens(pos, include_punct)
+        stop = len(tokens) if limit is None else min(offset + limit, len(tokens))
+        for i in range(offset, stop):
+            token = tokens[i]
+            yield {'n': i + 1, 'text': token.text, 'pos': token.pos, 'pos_name': pos_name_to_rus(token.pos),
+                   'lemma': token.lemma, 'feats': translate_features(token.feats)}
+
+    def morph_analysis_chunks(self, pos=None, include_punct=False, offset=0, limit=None, chunk_size=500):
+        # generating html code
+        yield morph_table_head
+        rows = self.morph_rows(pos, include_punct, offset, limit)
+        while True:
+            chunk = ''.join(islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+        yield morph_table_tail
+
+    def morhp_analysis(self, pos=None, include_punct=False, offset=0, limit=None):
+        return ''.join(self.morph_analysis_chunks(pos, include_punct, offset, limit))
 
     def gen_stats_data(self):
         res = ''
-        for stat in (f'Всего предложений: {len(self.doc.sents)}',
+        for stat in (f'Всего предложений: {self.total_sentences()}',
                      f'Средняя длина предложений: {self.avg_sent_len()}'):
             res += br(stat)
         return p(res)
@@ -140,20 +165,15 @@ class HtmlTP(TextProcessing):
         return table_to_html(('Часть речи', 'Абсолютная(словоупотребления)', 'Относительная(словоупотребления)',
                               'Абсолютная(слова)', 'Относительная(слова)'), processed_freqs)
 
-    def pos_freq_graph(self, use_tokens=True):
+    def pos_freq_chart(self, use_tokens=True):
         data = sorted(self.pos_freq_compute(), key=lambda x: x[0] if use_tokens else x[4], reverse=True)
         absolutes = tuple(v[0] if use_tokens else v[4] for v in data)
         poses = tuple(f'{v[3]} ({v[2]})' for v in data)
-        plt.rcParams['ytick.labelsize'] = 12
-        fig, ax = plt.subplots()
-        fig.set_size_inches(20, 8, forward=True)
-        ax.barh(poses, absolutes, align='center')
-        ax.set_yticks(poses)
-        ax.set_yticklabels(poses)
-        ax.invert_yaxis()
-        fig.suptitle('Абсолютная частота(словоупотребления)' if use_tokens else 'Абсолютная частота(слова)',
-                     fontsize=20)
-        return fig_to_html(fig)
+        return bar_chart('Абсолютная частота(словоупотребления)' if use_tokens else 'Абсолютная частота(слова)',
+                         poses, absolutes)
+
+    def pos_freq_graph(self, use_tokens=True, fmt='png'):
+        return renderer.render(self.pos_freq_chart(use_tokens), fmt)
 
     def omon_freq(self, top=None, include_stopwords=True):
         processed_freqs = tuple((t[0], str(t[1]), str(t[2]) + '%') for t in
@@ -171,35 +191,29 @@ class HtmlTP(TextProcessing):
             ('Падеж', 'abs(сущ.+им.собств.)', 'rel(сущ.+им.собств.)', 'abs(прилагательные)',
              'rel(прилагательные)', '&#8721; abs', '&#8721; rel'), processed_freqs)
 
-    def case_analysis_graph_nouns(self):
-        data = self.case_analysis()
-        labels = tuple(cases_translation[d[0]] for d in data if d[2] != 0)
-        sizes = tuple(d[2] for d in data if d[2] != 0)
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%', shadow=True, startangle=90)
-        ax1.axis('equal')
-        fig1.suptitle('Распределение падежей по существительным и именам собственным')
-        return fig_to_html(fig1)
-
-    def case_analysis_graph_adjs(self):
-        data = self.case_analysis()
-        labels = tuple(cases_translation[d[0]] for d in data if d[4] != 0)
-        sizes = tuple(d[4] for d in data if d[4] != 0)
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%', shadow=True, startangle=90)
-        ax1.axis('equal')
-        fig1.suptitle('Распределение падежей по прилагательным')
-        return fig_to_html(fig1)
-
-    def case_analysis_graph_sum(self):
+    def case_analysis_chart(self, column, title):
         data = self.case_analysis()
-        labels = tuple(cases_translation[d[0]] for d in data if d[6] != 0)
-        sizes = tuple(d[6] for d in data if d[6] != 0)
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels, autopct='%1.1f%%', shadow=True, startangle=90)
-        ax1.axis('equal')
-        fig1.suptitle('Суммарное распределение падежей')
-        return fig_to_html(fig1)
+        labels = tuple(cases_translation[d[0]] for d in data if d[column] != 0)
+        sizes = tuple(d[column] for d in data if d[column] != 0)
+        return pie_chart(title, labels, sizes)
+
+    def case_analysis_chart_nouns(self):
+        return self.case_analysis_chart(2, 'Распределение падежей по существительным и именам собственным')
+
+    def case_analysis_chart_adjs(self):
+        return self.case_analysis_chart(4, 'Распределение падежей по прилагательным')
+
+    def case_analysis_chart_sum(self):
+        return self.case_analysis_chart(6, 'Суммарное распределение падежей')
+
+    def case_analysis_graph_nouns(self, fmt='png'):
+        return renderer.render(self.case_analysis_chart_nouns(), fmt)
+
+    def case_analysis_graph_adjs(self, fmt='png'):
+        return renderer.render(self.case_analysis_chart_adjs(), fmt)
+
+    def case_analysis_graph_sum(self, fmt='png'):
+        return renderer.render(self.case_analysis_chart_sum(), fmt)
 
     def verb_form_analysis_tense_table(self):
         processed_freqs = tuple((translation_values[t[0]], str(t[1])) for t in self.verb_form_analysis_tense())
@@ -213,8 +227,8 @@ class HtmlTP(TextProcessing):
         processed_freqs = tuple((translation_values[t[0]], str(t[1])) for t in self.verb_form_analysis_number())
         return table_to_html(('Число', 'Количество словоупотреблений'), processed_freqs)
 
-    def summary(self):
-        return ' '.join(self.simple_summarization())
+    def summary(self, weights=None):
+        return ' '.join(self.simple_summarization(weights=weights))
 
     def ner_stats_view(self):
         res = ''
@@ -230,4 +244,44 @@ class HtmlTP(TextProcessing):
         h = ('Начальная форма', 'Количество')
         return p('Личности') + table_to_html(h, pers) + \
                p('Локации') + table_to_html(h, locs) + \
-               p('Организации') + table_to_html(h, orgs)
\ No newline at end of file
+               p('Организации') + table_to_html(h, orgs)
+
+# Разделы ответов: название -> функция от HtmlTP; для графиков функция возвращает описание графика
+process_sections = {'gen_stat_data': lambda tp: tp.gen_stats_data(),
+                    'gen_stat_data_with_punct': lambda tp: tp.gen_stats_with_punct(),
+                    'gen_stat_data_wo_punct': lambda tp: tp.gen_stats_wo_punct(),
+                    'pos_stat_table': lambda tp: tp.pos_freq(),
+                    'pos_stat_graph_uses': lambda tp: tp.pos_freq_chart(),
+                    'pos_stat_graph_words': lambda tp: tp.pos_freq_chart(use_tokens=False),
+                    'omon_stat_table': lambda tp: tp.omon_freq(10),
+                    'omon_stat_table_wo_stopwords': lambda tp: tp.omon_freq(10, include_stopwords=False),
+                    'case_analysis_table': lambda tp: tp.case_analysis_table(),
+                    'case_analysis_graph_nouns': lambda tp: tp.case_analysis_chart_nouns(),
+                    'case_analysis_graph_adjs': lambda tp: tp.case_analysis_chart_adjs(),
+                    'case_analysis_graph_sum': lambda tp: tp.case_analysis_chart_sum(),
+                    'verb_forms_analysis_tense_table': lambda tp: tp.verb_form_analysis_tense_table(),
+                    'verb_forms_analysis_person_table': lambda tp: tp.verb_form_analysis_person_table(),
+                    'verb_forms_analysis_number_table': lambda tp: tp.verb_form_analysis_number_table(),
+                    'ner_general': lambda tp: tp.ner_stats_view(),
+                    'ner_tables': lambda tp: tp.top_ners_table(),
+                    }
+chart_sections = ('pos_stat_graph_uses', 'pos_stat_graph_words',
+                  'case_analysis_graph_nouns', 'case_analysis_graph_adjs', 'case_analysis_graph_sum')
+# Разделам с именованными сущностями нужен полный конвейер, остальным хватает морфологии и лемм
+ner_sections = ('ner_general', 'ner_tables')
+morph_sections = {'morph_analysis_table': lambda tp: tp.morhp_analysis(include_punct=True)}
+summary_sections = {'summ_text': lambda tp: tp.summary()}
+
+
+def iter_sections(tp, sections, fmt='png'):
+    # Графики уходят в пул отрисовки заранее и рисуются, пока считаются таблицы
+    charts = {name: renderer.submit(sections[name](tp), fmt) for name in sections if name in chart_sections}
+    for name, compute in sections.items():
+        if name not in charts:
+            with timed(section_seconds, section=name):
+                value = compute(tp)
+            yield name, value
+    for name, future in charts.items():
+        with timed(section_seconds, section=name):
+            value = future.result()
+        yield name, value